@@ -0,0 +1,455 @@
+#!/usr/bin/env python3
+
+# benchmarks/run_benchmarks.py
+#
+# Offline benchmarks for the trading hot paths. Everything runs in a scratch
+# directory against the local SimulatedBroker, so no network or Alpaca
+# credentials are needed and the repo's data/, logs/ and database/ are untouched.
+#
+#   python -m benchmarks.run_benchmarks run --output before.json
+#   python -m benchmarks.run_benchmarks run --modules 1,10,50 --history-sizes 0,10000 --output after.json
+#   python -m benchmarks.run_benchmarks compare before.json after.json --threshold 0.15
+#
+# Every benchmark runs --warmup untimed rounds and then --trials timed ones.
+# Results hold the median of each metric over the trials, and compare only
+# flags a regression when the change is beyond the spread between trials.
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import logging
+from types import ModuleType, SimpleNamespace
+from termcolor import colored
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARKS = ('order_path', 'state_save', 'sqlite_insert', 'api_modules')
+
+# Metrics checked by compare; *_per_second is higher-is-better, the rest lower-is-better
+COMPARED_METRICS = ('mean_seconds', 'p50_seconds', 'p95_seconds', 'operations_per_second', 'mean_wake_lag_seconds', 'p95_wake_lag_seconds')
+
+
+def _int_list(value):
+    return [int(item) for item in value.split(',') if item]
+
+
+def _percentile(sorted_samples, fraction):
+    if not sorted_samples:
+        return None
+    index = min(len(sorted_samples) - 1, int(round(fraction * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+
+# Latency summary for a list of per-operation timings
+def summarize(samples, elapsed=None):
+    samples = sorted(samples)
+    if elapsed is None:
+        elapsed = sum(samples)
+    return {
+        'count': len(samples),
+        'mean_seconds': sum(samples) / len(samples) if samples else None,
+        'p50_seconds': _percentile(samples, 0.50),
+        'p95_seconds': _percentile(samples, 0.95),
+        'p99_seconds': _percentile(samples, 0.99),
+        'max_seconds': samples[-1] if samples else None,
+        'operations_per_second': len(samples) / elapsed if elapsed > 0 else None,
+    }
+
+
+# Prepare a scratch working directory and import the bot from inside it, since
+# the bot's modules create logs/, data/ and database/ relative to the cwd on import
+def prepare_environment(workdir):
+    os.makedirs(os.path.join(workdir, 'logs'), exist_ok=True)
+    os.makedirs(os.path.join(workdir, 'config'), exist_ok=True)
+    shutil.copy(os.path.join(REPO_DIR, 'config', 'config.json'), os.path.join(workdir, 'config', 'config.json'))
+    os.chdir(workdir)
+    if REPO_DIR not in sys.path:
+        sys.path.insert(0, REPO_DIR)
+
+    import bot
+    from utils import alpaca_utils, trade_history_utils
+    from utils.simulated_broker import SimulatedBroker
+
+    # Per-order INFO logging to the console would dominate every timing
+    logging.getLogger().setLevel(logging.WARNING)
+    return SimpleNamespace(
+        bot=bot,
+        alpaca_utils=alpaca_utils,
+        trade_history_utils=trade_history_utils,
+        simulated_broker_class=SimulatedBroker
+    )
+
+
+def _symbols(count):
+    return [f'SYM{index}' for index in range(count)]
+
+
+def _history(size):
+    return [
+        {"action": "buy" if index % 2 == 0 else "sell", "symbol": "SYM0", "quantity": 1, "price": 100.0, "timestamp": 1700000000.0 + index}
+        for index in range(size)
+    ]
+
+
+# Point the trade history at a new, empty database so a result doesn't depend on
+# which parameter combinations or trials ran before it
+def _use_fresh_trade_history(env, name):
+    env.trade_history_utils.close_trade_history()
+    path = os.path.join('database', f'{name}.db')
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    env.trade_history_utils.init_trade_history(path)
+
+
+# buy_stock/sell_stock through the simulated broker, optionally paced to a target
+# order rate. The state file is restored before every order (outside the timing),
+# so every order sees a history of exactly history_size entries.
+def bench_order_path(env, symbols, orders, history_size, rate):
+    broker = env.simulated_broker_class(cash=1e12)
+    for symbol in _symbols(symbols):
+        broker.push_bar(symbol, {'t': 0, 'c': 100.0, 'v': 10 ** 12})
+    env.alpaca_utils.use_simulated_broker(broker)
+
+    module_name = f'bench_orders_{symbols}_{history_size}'
+    _use_fresh_trade_history(env, f'{module_name}_{orders}')
+    env.alpaca_utils.set_module_mode(module_name, 'test')
+    env.alpaca_utils.save_module_state(module_name, {
+        "max_money_per_day": 1e12,
+        "max_money_per_transaction": 1e12,
+        "history": _history(history_size)
+    })
+    state_path = f'{env.alpaca_utils.data_directory}{module_name}_state.json'
+    with open(state_path, 'rb') as state_file:
+        state_bytes = state_file.read()
+
+    symbol_names = _symbols(symbols)
+    interval = 1.0 / rate if rate else 0.0
+    samples = []
+    start = time.perf_counter()
+    for index in range(orders):
+        with open(state_path, 'wb') as state_file:
+            state_file.write(state_bytes)
+        if interval:
+            delay = start + index * interval - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        symbol = symbol_names[index % symbols]
+        order_start = time.perf_counter()
+        if index % 2 == 0:
+            env.alpaca_utils.buy_stock(symbol, 1, module_name)
+        else:
+            env.alpaca_utils.sell_stock(symbol, 1, module_name)
+        samples.append(time.perf_counter() - order_start)
+    elapsed = time.perf_counter() - start
+    env.alpaca_utils.use_simulated_broker(None)
+
+    metrics = summarize(samples, elapsed)
+    metrics['target_orders_per_second'] = rate
+    return metrics
+
+
+# save_module_state/load_module_state cost as the JSON history grows
+def bench_state_save(env, history_size, repeat):
+    module_name = f'bench_state_{history_size}'
+    state = {"max_money_per_day": 1000, "max_money_per_transaction": 500, "history": _history(history_size)}
+
+    save_samples = []
+    load_samples = []
+    for _ in range(repeat):
+        operation_start = time.perf_counter()
+        env.alpaca_utils.save_module_state(module_name, state)
+        save_samples.append(time.perf_counter() - operation_start)
+        operation_start = time.perf_counter()
+        env.alpaca_utils.load_module_state(module_name)
+        load_samples.append(time.perf_counter() - operation_start)
+
+    metrics = summarize(save_samples)
+    metrics['load_mean_seconds'] = sum(load_samples) / len(load_samples)
+    metrics['file_bytes'] = os.path.getsize(f'{env.alpaca_utils.data_directory}{module_name}_state.json')
+    return metrics
+
+
+# Fill inserts into action_history with rollup maintenance, then P&L query latency
+def bench_sqlite_insert(env, modules, symbols, orders):
+    _use_fresh_trade_history(env, f'bench_sqlite_{modules}_{symbols}_{orders}')
+    symbol_names = _symbols(symbols)
+    samples = []
+    start = time.perf_counter()
+    for index in range(orders):
+        module_name = f'bench_sqlite_{index % modules}'
+        action = 'buy' if (index // modules) % 2 == 0 else 'sell'
+        operation_start = time.perf_counter()
+        env.trade_history_utils.record_trade(module_name, action, symbol_names[index % symbols], 1, 100.0 + index % 7)
+        samples.append(time.perf_counter() - operation_start)
+    elapsed = time.perf_counter() - start
+    metrics = summarize(samples, elapsed)
+
+    query_start = time.perf_counter()
+    env.trade_history_utils.get_pnl(module_name='bench_sqlite_0')
+    metrics['pnl_query_seconds'] = time.perf_counter() - query_start
+    query_start = time.perf_counter()
+    env.trade_history_utils.get_trades(module_name='bench_sqlite_0', limit=100)
+    metrics['trades_page_seconds'] = time.perf_counter() - query_start
+    return metrics
+
+
+# Benchmark module: sleeps `interval` per tick and records how late each wake-up was
+def _make_bench_module(name, wake_lags):
+    module = ModuleType(f'modules.{name}')
+
+    def run(mode, stop_event, params):
+        interval = params.get('interval', 0.01)
+        lags = wake_lags.setdefault(name, [])
+        while not stop_event.is_set():
+            expected = time.perf_counter() + interval
+            if stop_event.wait(interval):
+                break
+            lags.append(time.perf_counter() - expected)
+
+    module.run = run
+    return module
+
+
+# /start_module, /status and /stop_module latency and module wake-up lag with N modules running
+def bench_api_modules(env, modules, duration, status_requests):
+    client = env.bot.app.test_client()
+    wake_lags = {}
+    names = [f'benchmark_module_{modules}_{index}' for index in range(modules)]
+    for name in names:
+        sys.modules[f'modules.{name}'] = _make_bench_module(name, wake_lags)
+
+    start_samples = []
+    try:
+        for name in names:
+            request_start = time.perf_counter()
+            response = client.post('/start_module', json={'module_name': name, 'mode': 'test', 'params': {'interval': 0.01}})
+            start_samples.append(time.perf_counter() - request_start)
+            if response.status_code != 200:
+                raise RuntimeError(f"Failed to start {name}: {response.get_json()}")
+
+        status_samples = []
+        deadline = time.perf_counter() + duration
+        while len(status_samples) < status_requests or time.perf_counter() < deadline:
+            request_start = time.perf_counter()
+            client.get('/status')
+            status_samples.append(time.perf_counter() - request_start)
+            if len(status_samples) >= status_requests:
+                time.sleep(0.01)
+    finally:
+        stop_samples = []
+        for name in names:
+            request_start = time.perf_counter()
+            client.post('/stop_module', json={'module_name': name})
+            stop_samples.append(time.perf_counter() - request_start)
+            sys.modules.pop(f'modules.{name}', None)
+
+    lags = sorted(lag for module_lags in wake_lags.values() for lag in module_lags)
+    metrics = summarize(status_samples)
+    metrics['start_module_mean_seconds'] = sum(start_samples) / len(start_samples)
+    metrics['start_module_p95_seconds'] = _percentile(sorted(start_samples), 0.95)
+    metrics['stop_module_mean_seconds'] = sum(stop_samples) / len(stop_samples)
+    metrics['mean_wake_lag_seconds'] = sum(lags) / len(lags) if lags else None
+    metrics['p95_wake_lag_seconds'] = _percentile(lags, 0.95)
+    metrics['module_ticks'] = len(lags)
+    return metrics
+
+
+# Run a benchmark `warmup` times without keeping the results, then `trials`
+# times. Returns the median of every numeric metric and the per-trial values of
+# the compared metrics.
+def _run_trials(args, benchmark, *arguments):
+    for _ in range(args.warmup):
+        benchmark(*arguments)
+    trials = [benchmark(*arguments) for _ in range(args.trials)]
+
+    metrics = {}
+    trial_values = {}
+    for key in trials[0]:
+        values = [trial[key] for trial in trials if isinstance(trial.get(key), (int, float))]
+        if not values:
+            metrics[key] = trials[0][key]
+            continue
+        metrics[key] = statistics.median(values)
+        if key in COMPARED_METRICS:
+            trial_values[key] = values
+    metrics['trials'] = len(trials)
+    return metrics, trial_values
+
+
+def _record(results, name, params, measured):
+    metrics, trial_values = measured
+    results.append({'name': name, 'params': params, 'metrics': metrics, 'trial_values': trial_values})
+    summary = ', '.join(
+        f"{key}={value:.6g} ({min(trial_values[key]):.6g}..{max(trial_values[key]):.6g})"
+        for key, value in metrics.items()
+        if key in trial_values
+    )
+    print(colored(f"{name} {params}", 'cyan'), summary, file=sys.stderr)
+
+
+def run_benchmarks(args):
+    selected = args.benchmarks.split(',') if args.benchmarks else BENCHMARKS
+    for name in selected:
+        if name not in BENCHMARKS:
+            print(colored(f"Unknown benchmark '{name}'. Available: {', '.join(BENCHMARKS)}", 'red'), file=sys.stderr)
+            sys.exit(2)
+    if args.trials < 1 or args.warmup < 0:
+        print(colored("--trials must be at least 1 and --warmup at least 0", 'red'), file=sys.stderr)
+        sys.exit(2)
+
+    original_cwd = os.getcwd()
+    output_path = os.path.abspath(args.output) if args.output else None
+    workdir = tempfile.mkdtemp(prefix='trading_bot_bench_')
+    results = []
+    try:
+        env = prepare_environment(workdir)
+
+        if 'order_path' in selected:
+            for symbols in args.symbols:
+                for history_size in args.history_sizes:
+                    params = {'symbols': symbols, 'history_size': history_size, 'orders': args.orders, 'rate': args.rate}
+                    _record(results, 'order_path', params, _run_trials(args, bench_order_path, env, symbols, args.orders, history_size, args.rate))
+
+        if 'state_save' in selected:
+            for history_size in args.history_sizes:
+                params = {'history_size': history_size, 'repeat': args.repeat}
+                _record(results, 'state_save', params, _run_trials(args, bench_state_save, env, history_size, args.repeat))
+
+        if 'sqlite_insert' in selected:
+            for modules in args.modules:
+                for symbols in args.symbols:
+                    params = {'modules': modules, 'symbols': symbols, 'orders': args.orders}
+                    _record(results, 'sqlite_insert', params, _run_trials(args, bench_sqlite_insert, env, modules, symbols, args.orders))
+
+        if 'api_modules' in selected:
+            for modules in args.modules:
+                params = {'modules': modules, 'duration': args.duration}
+                _record(results, 'api_modules', params, _run_trials(args, bench_api_modules, env, modules, args.duration, args.repeat))
+    finally:
+        os.chdir(original_cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'warmup': args.warmup,
+        'trials': args.trials,
+        'results': results,
+    }
+    if output_path:
+        with open(output_path, 'w') as output_file:
+            json.dump(report, output_file, indent=4)
+        print(colored(f"Results written to {output_path}", 'green'), file=sys.stderr)
+    else:
+        print(json.dumps(report, indent=4))
+
+
+def _result_key(result):
+    return (result['name'], json.dumps(result['params'], sort_keys=True))
+
+
+# Lowest and highest value of a metric over a result's trials (just the value
+# for results saved without per-trial values)
+def _trial_range(result, metric):
+    values = result.get('trial_values', {}).get(metric)
+    if not values:
+        value = result['metrics'][metric]
+        return value, value
+    return min(values), max(values)
+
+
+# Compare two result files. A metric regresses when its median got worse by more
+# than the threshold and every current trial is worse than every baseline trial;
+# changes inside the spread between trials are reported as noise.
+def compare_results(args):
+    with open(args.baseline, 'r') as baseline_file:
+        baseline = {_result_key(result): result for result in json.load(baseline_file)['results']}
+    with open(args.current, 'r') as current_file:
+        current = json.load(current_file)['results']
+
+    regressions = 0
+    current_keys = {_result_key(result) for result in current}
+    for key, result in baseline.items():
+        if key not in current_keys:
+            print(colored(f"{result['name']} {result['params']}: missing from current run", 'yellow'))
+
+    for result in current:
+        previous = baseline.get(_result_key(result))
+        if previous is None:
+            print(colored(f"{result['name']} {result['params']}: no baseline", 'yellow'))
+            continue
+        print(colored(f"{result['name']} {result['params']}", 'cyan', attrs=['bold']))
+        for metric in COMPARED_METRICS:
+            old_value = previous['metrics'].get(metric)
+            new_value = result['metrics'].get(metric)
+            if not old_value or new_value is None:
+                continue
+            change = (new_value - old_value) / old_value
+            old_low, old_high = _trial_range(previous, metric)
+            new_low, new_high = _trial_range(result, metric)
+            # Throughput regresses when it drops, latency when it rises
+            if metric.endswith('_per_second'):
+                worse = -change
+                beyond_spread = new_high < old_low
+                better_beyond_spread = new_low > old_high
+            else:
+                worse = change
+                beyond_spread = new_low > old_high
+                better_beyond_spread = new_high < old_low
+            line = f"  {metric}: {old_value:.6g} -> {new_value:.6g} ({change:+.1%})"
+            if worse > args.threshold and beyond_spread:
+                regressions += 1
+                print(colored(line + "  REGRESSION", 'red'))
+            elif worse > args.threshold:
+                print(colored(line + "  within trial spread", 'yellow'))
+            elif worse < -args.threshold and better_beyond_spread:
+                print(colored(line + "  improved", 'green'))
+            else:
+                print(line)
+
+    if regressions:
+        print(colored(f"{regressions} regression(s) above {args.threshold:.0%}", 'red', attrs=['bold']))
+        sys.exit(1)
+    print(colored("No regressions", 'green', attrs=['bold']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline benchmarks for the trading bot hot paths.')
+
+    subparsers = parser.add_subparsers(title='Commands', dest='command')
+    subparsers.required = True
+
+    # Run Command
+    parser_run = subparsers.add_parser('run', help='Run the benchmarks and emit JSON results')
+    parser_run.add_argument('--benchmarks', help=f"Comma separated subset of: {', '.join(BENCHMARKS)}")
+    parser_run.add_argument('--modules', type=_int_list, default=[1, 10], help='Comma separated module counts')
+    parser_run.add_argument('--symbols', type=_int_list, default=[1, 10], help='Comma separated symbol counts')
+    parser_run.add_argument('--history-sizes', type=_int_list, default=[0, 1000, 10000], help='Comma separated state history sizes')
+    parser_run.add_argument('--orders', type=int, default=500, help='Orders per order path and SQLite run')
+    parser_run.add_argument('--rate', type=float, help='Target orders per second for the order path (default: as fast as possible)')
+    parser_run.add_argument('--repeat', type=int, default=20, help='Repetitions for state saves and /status requests')
+    parser_run.add_argument('--duration', type=float, default=2.0, help='Seconds to keep modules running in api_modules')
+    parser_run.add_argument('--trials', type=int, default=5, help='Timed runs of every benchmark; results are the median')
+    parser_run.add_argument('--warmup', type=int, default=1, help='Untimed runs of every benchmark before the trials')
+    parser_run.add_argument('--output', help='Write results to this JSON file instead of stdout')
+    parser_run.set_defaults(func=run_benchmarks)
+
+    # Compare Command
+    parser_compare = subparsers.add_parser('compare', help='Compare two result files and flag regressions')
+    parser_compare.add_argument('baseline', help='Results from the earlier run')
+    parser_compare.add_argument('current', help='Results from the new run')
+    parser_compare.add_argument('--threshold', type=float, default=0.15, help='Relative change of the median counted as a regression, if it is also beyond the spread between trials')
+    parser_compare.set_defaults(func=compare_results)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == '__main__':
+    main()
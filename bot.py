@@ -7,9 +7,9 @@ import importlib
 import os
 import json
 import time
-from utils import configuration_utils, state_utils
+from utils import configuration_utils, state_utils, trade_history_utils
 import threading
-from utils.alpaca_utils import save_module_state
+from utils.alpaca_utils import save_module_state, set_module_mode, sync_order_fills, update_position_marks
 from logging.handlers import RotatingFileHandler
 import sqlite3
 
@@ -46,7 +46,7 @@ if not os.path.exists('database'):
 conn = sqlite3.connect('database/trading_bot.db', check_same_thread=False)
 cursor = conn.cursor()
 
-# Create tables for module states and action history if they don't exist
+# Create the module state table if it doesn't exist
 cursor.execute('''
 CREATE TABLE IF NOT EXISTS module_state (
     module_name TEXT PRIMARY KEY,
@@ -55,19 +55,11 @@ CREATE TABLE IF NOT EXISTS module_state (
     history TEXT
 )
 ''')
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS action_history (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    module_name TEXT,
-    action TEXT,
-    symbol TEXT,
-    quantity INTEGER,
-    price REAL,
-    timestamp REAL
-)
-''')
 conn.commit()
 
+# Create the indexed trade history and P&L rollup tables
+trade_history_utils.init_trade_history()
+
 # Load configuration
 def load_configuration():
     with open('config/config.json', 'r') as config_file:
@@ -91,6 +83,9 @@ def start_module():
             # Import the module dynamically
             module = importlib.import_module(f"modules.{module_name}")
 
+            # Route the module's orders to the simulated broker in test mode
+            set_module_mode(module_name, mode)
+
             # Create a stop event
             stop_event = threading.Event()
 
@@ -153,6 +148,47 @@ def status():
         'running_modules': list(running_modules.keys())
     }), 200
 
+# Flask route to page through trade history
+@app.route('/trades', methods=['GET'])
+def trades():
+    try:
+        result = trade_history_utils.get_trades(
+            module_name=request.args.get('module_name'),
+            symbol=request.args.get('symbol'),
+            since=request.args.get('since', type=float),
+            until=request.args.get('until', type=float),
+            before=request.args.get('before'),
+            limit=request.args.get('limit', trade_history_utils.DEFAULT_PAGE_SIZE, type=int),
+            venue=request.args.get('venue', trade_history_utils.DEFAULT_VENUE)
+        )
+        return jsonify(result), 200
+    except ValueError as e:
+        return jsonify({'status': 'Error', 'message': str(e)}), 400
+    except Exception as e:
+        logging.error(f"Error querying trade history: {str(e)}")
+        return jsonify({'status': 'Error', 'message': str(e)}), 500
+
+# Flask route to get realized and unrealized P&L
+@app.route('/pnl', methods=['GET'])
+def pnl():
+    group_by = request.args.get('group_by')
+    group_by = [column for column in group_by.split(',') if column] if group_by is not None else trade_history_utils.PNL_GROUP_COLUMNS
+    try:
+        result = trade_history_utils.get_pnl(
+            module_name=request.args.get('module_name'),
+            symbol=request.args.get('symbol'),
+            start_day=request.args.get('start_day'),
+            end_day=request.args.get('end_day'),
+            group_by=group_by,
+            venue=request.args.get('venue', trade_history_utils.DEFAULT_VENUE)
+        )
+        return jsonify(result), 200
+    except ValueError as e:
+        return jsonify({'status': 'Error', 'message': str(e)}), 400
+    except Exception as e:
+        logging.error(f"Error querying P&L: {str(e)}")
+        return jsonify({'status': 'Error', 'message': str(e)}), 500
+
 def start_module_internal(module_name, config):
     mode = config.get('mode', 'test')
     params = config.get('params', {})
@@ -193,6 +229,10 @@ if __name__ == '__main__':
                 config = load_configuration()
                 logging.info("Configuration reloaded.")
 
+            # Record new fills of submitted orders and refresh marks for unrealized P&L
+            sync_order_fills()
+            update_position_marks()
+
             # Save state periodically
             if state_utils.time_to_backup():
                 state_utils.backup_state(running_modules)
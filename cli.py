@@ -71,6 +71,43 @@ def bot_status(args):
         print(colored(f"Error connecting to the bot: {e}", 'red'))
         sys.exit(1)
 
+def trade_history(args):
+    endpoint = f'{API_URL}/trades'
+    params = {
+        'module_name': args.module_name,
+        'symbol': args.symbol,
+        'since': args.since,
+        'until': args.until,
+        'before': args.before,
+        'limit': args.limit,
+        'venue': args.venue
+    }
+
+    try:
+        response = requests.get(endpoint, params={k: v for k, v in params.items() if v is not None})
+        print_response(response)
+    except requests.exceptions.RequestException as e:
+        print(colored(f"Error connecting to the bot: {e}", 'red'))
+        sys.exit(1)
+
+def pnl_report(args):
+    endpoint = f'{API_URL}/pnl'
+    params = {
+        'module_name': args.module_name,
+        'symbol': args.symbol,
+        'start_day': args.start_day,
+        'end_day': args.end_day,
+        'group_by': args.group_by,
+        'venue': args.venue
+    }
+
+    try:
+        response = requests.get(endpoint, params={k: v for k, v in params.items() if v is not None})
+        print_response(response)
+    except requests.exceptions.RequestException as e:
+        print(colored(f"Error connecting to the bot: {e}", 'red'))
+        sys.exit(1)
+
 def stop_bot(args):
     print(colored("Stopping the bot...", 'yellow', attrs=['bold']))
     try:
@@ -148,6 +185,27 @@ def main():
     parser_status = subparsers.add_parser('status', help='Get the status of the bot')
     parser_status.set_defaults(func=bot_status)
 
+    # Trade History Command
+    parser_trades = subparsers.add_parser('trades', help='Show trade history, newest first')
+    parser_trades.add_argument('--module_name', help='Only show trades of this module')
+    parser_trades.add_argument('--symbol', help='Only show trades in this symbol')
+    parser_trades.add_argument('--since', type=float, help='Only show trades at or after this Unix timestamp')
+    parser_trades.add_argument('--until', type=float, help='Only show trades before this Unix timestamp')
+    parser_trades.add_argument('--before', help='Show the page of trades before this cursor (next_before of the previous page)')
+    parser_trades.add_argument('--limit', type=int, default=100, help='Number of trades per page')
+    parser_trades.add_argument('--venue', choices=['alpaca', 'simulated'], help='Show fills from this venue (default: alpaca)')
+    parser_trades.set_defaults(func=trade_history)
+
+    # P&L Command
+    parser_pnl = subparsers.add_parser('pnl', help='Show realized and unrealized P&L')
+    parser_pnl.add_argument('--module_name', help='Only include this module')
+    parser_pnl.add_argument('--symbol', help='Only include this symbol')
+    parser_pnl.add_argument('--start_day', help='First day to include (YYYY-MM-DD, UTC)')
+    parser_pnl.add_argument('--end_day', help='Last day to include (YYYY-MM-DD, UTC)')
+    parser_pnl.add_argument('--group_by', help='Comma separated grouping: any of module_name,symbol,day (default: all three)')
+    parser_pnl.add_argument('--venue', choices=['alpaca', 'simulated'], help='Report P&L of this venue (default: alpaca)')
+    parser_pnl.set_defaults(func=pnl_report)
+
     # List Modules Command
     parser_list = subparsers.add_parser('list_modules', help='List available modules')
     parser_list.set_defaults(func=list_modules)
@@ -0,0 +1,108 @@
+# tests/test_indicator_utils.py
+import math
+import statistics
+from datetime import datetime, timezone
+
+import pytest
+
+from utils import indicator_utils
+
+
+@pytest.fixture
+def indicators():
+    indicator_utils._indicator_cache.clear()
+    indicator_utils._symbol_indicators.clear()
+    yield indicator_utils
+    indicator_utils._indicator_cache.clear()
+    indicator_utils._symbol_indicators.clear()
+
+
+def _feed(indicator, prices, volumes=None):
+    volumes = volumes or [0.0] * len(prices)
+    return [indicator.update(price, volume, index) for index, (price, volume) in enumerate(zip(prices, volumes))]
+
+
+def test_sma_matches_reference():
+    values = _feed(indicator_utils.SMA(period=3), [1, 2, 3, 4, 5])
+    assert values == [None, None, 2.0, 3.0, 4.0]
+
+
+def test_ema_is_seeded_with_sma():
+    values = _feed(indicator_utils.EMA(period=3), [1, 2, 3, 4, 5])
+    assert values == [None, None, 2.0, 3.0, 4.0]
+    assert indicator_utils.EMA(period=3).alpha == pytest.approx(0.5)
+
+
+def test_rsi_uses_wilder_smoothing():
+    values = _feed(indicator_utils.RSI(period=3), [1, 2, 3, 2, 3])
+    assert values[:3] == [None, None, None]
+    # Seed: average gain 2/3, average loss 1/3
+    assert values[3] == pytest.approx(100 - 100 / (1 + 2))
+    # Then gain (2/3 * 2 + 1) / 3 and loss (1/3 * 2) / 3
+    assert values[4] == pytest.approx(100 - 100 / (1 + (7 / 9) / (2 / 9)))
+
+
+def test_vwap_cumulative_and_rolling():
+    prices, volumes = [10, 20, 30], [1, 3, 1]
+    assert _feed(indicator_utils.VWAP(), prices, volumes)[-1] == pytest.approx((10 * 1 + 20 * 3 + 30 * 1) / 5)
+    assert _feed(indicator_utils.VWAP(period=2), prices, volumes)[-1] == pytest.approx((20 * 3 + 30 * 1) / 4)
+
+
+def test_volatility_is_sample_stdev_of_log_returns():
+    prices = [100, 110, 99, 105, 103]
+    values = _feed(indicator_utils.Volatility(period=3), prices)
+    returns = [math.log(current / previous) for previous, current in zip(prices, prices[1:])]
+    assert values[2] is None
+    assert values[3] == pytest.approx(statistics.stdev(returns[0:3]))
+    assert values[4] == pytest.approx(statistics.stdev(returns[1:4]))
+
+
+def test_default_and_explicit_params_share_one_instance(indicators):
+    default = indicators.get_indicator('AAPL', 'sma')
+    assert default is indicators.get_indicator('AAPL', 'sma', period=20)
+    assert default is not indicators.get_indicator('AAPL', 'sma', period=10)
+    assert default is not indicators.get_indicator('MSFT', 'sma')
+
+
+def test_same_bar_is_applied_once_across_timestamp_types(indicators):
+    ema = indicators.get_indicator('AAPL', 'ema', period=3)
+    for minute, price in enumerate([1, 2, 3]):
+        seconds = 1700000000 + minute * 60
+        as_datetime = datetime.fromtimestamp(seconds, timezone.utc)
+        indicators.update_symbol('AAPL', price, timestamp=seconds)
+        indicators.update_all({'AAPL': {'c': price, 't': as_datetime}})
+        indicators.update_all({'AAPL': {'c': price, 't': as_datetime.isoformat().replace('+00:00', 'Z')}})
+    assert ema.value == pytest.approx(2.0)
+
+
+def test_bars_without_timestamp_are_rejected(indicators):
+    sma = indicators.get_indicator('AAPL', 'sma', period=1)
+    with pytest.raises(ValueError):
+        indicators.update_symbol('AAPL', 1.0)
+    with pytest.raises(ValueError):
+        indicators.update_all({'AAPL': {'c': 1.0}})
+    assert sma.value is None
+
+
+def test_invalid_bar_leaves_the_whole_batch_unapplied(indicators):
+    aapl = indicators.get_indicator('AAPL', 'sma', period=1)
+    msft = indicators.get_indicator('MSFT', 'sma', period=1)
+    with pytest.raises(ValueError):
+        indicators.update_all({'AAPL': {'c': 1.0, 't': 1}, 'MSFT': {'t': 1}})
+    assert aapl.value is None and msft.value is None
+
+
+def test_clear_indicator_cache_resets_instances_in_place(indicators):
+    sma = indicators.get_indicator('AAPL', 'sma', period=2)
+    indicators.update_symbol('AAPL', 10.0, timestamp=1)
+    indicators.update_symbol('AAPL', 20.0, timestamp=2)
+    assert sma.value == pytest.approx(15.0)
+
+    indicators.clear_indicator_cache()
+    assert sma.value is None
+    assert indicators.get_indicator('AAPL', 'sma', period=2) is sma
+
+    # Timestamps restart too, and the held instance keeps updating
+    indicators.update_symbol('AAPL', 1.0, timestamp=1)
+    indicators.update_symbol('AAPL', 3.0, timestamp=2)
+    assert sma.value == pytest.approx(2.0)
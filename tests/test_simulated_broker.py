@@ -0,0 +1,146 @@
+# tests/test_simulated_broker.py
+import importlib
+
+import pytest
+
+from utils import trade_history_utils
+from utils.simulated_broker import SimulatedBroker, SimulatedBrokerError
+
+
+def _bars(*closes, volume=1000, start=0, step=60):
+    return [{'t': start + index * step, 'c': close, 'v': volume} for index, close in enumerate(closes)]
+
+
+def test_latency_holds_orders_until_bar_time_passes():
+    broker = SimulatedBroker(bars={'AAPL': _bars(100.0, 101.0, 102.0)}, latency=90)
+    broker.advance()
+    order = broker.submit_order('AAPL', 5, 'buy')
+
+    broker.advance()
+    assert broker.get_order(order.id).status == 'new'
+    broker.advance()
+    filled = broker.get_order(order.id)
+    assert filled.status == 'filled'
+    assert filled.filled_avg_price == pytest.approx(102.0)
+
+
+def test_participation_splits_fills_across_bars():
+    broker = SimulatedBroker(bars={'AAPL': _bars(100.0, 110.0, volume=100)}, participation=0.3)
+    broker.advance()
+    order = broker.submit_order('AAPL', 50, 'buy')
+    partial = broker.get_order(order.id)
+    assert (partial.status, partial.filled_qty) == ('partially_filled', 30)
+
+    broker.advance()
+    filled = broker.get_order(order.id)
+    assert (filled.status, filled.filled_qty) == ('filled', 50)
+    assert filled.filled_avg_price == pytest.approx((30 * 100.0 + 20 * 110.0) / 50)
+
+
+def test_slippage_moves_price_against_the_order():
+    broker = SimulatedBroker(bars={'AAPL': _bars(100.0)}, slippage_bps=50)
+    broker.advance()
+    buy = broker.submit_order('AAPL', 1, 'buy')
+    sell = broker.submit_order('AAPL', 1, 'sell')
+    assert buy.filled_avg_price == pytest.approx(100.5)
+    assert sell.filled_avg_price == pytest.approx(99.5)
+
+
+def test_limit_order_rests_until_price_crosses():
+    broker = SimulatedBroker(bars={'AAPL': _bars(100.0, 97.0)})
+    broker.advance()
+    order = broker.submit_order('AAPL', 5, 'buy', type='limit', limit_price=98.0)
+    assert order.status == 'new'
+    assert [open_order.id for open_order in broker.list_orders()] == [order.id]
+
+    broker.advance()
+    filled = broker.get_order(order.id)
+    assert filled.status == 'filled'
+    assert filled.filled_avg_price == pytest.approx(97.0)
+    assert broker.list_orders() == []
+
+
+def test_ioc_cancels_the_unfilled_rest():
+    broker = SimulatedBroker(bars={'AAPL': _bars(100.0, volume=10)}, participation=1.0)
+    broker.advance()
+    order = broker.submit_order('AAPL', 25, 'buy', time_in_force='ioc')
+    assert (order.status, order.filled_qty) == ('canceled', 10)
+
+
+def test_cancel_order_stops_further_fills():
+    broker = SimulatedBroker(bars={'AAPL': _bars(100.0, 101.0)}, latency=120)
+    broker.advance()
+    order = broker.submit_order('AAPL', 5, 'buy')
+    broker.cancel_order(order.id)
+
+    broker.advance()
+    assert broker.get_order(order.id).status == 'canceled'
+    assert broker.list_positions() == []
+    with pytest.raises(SimulatedBrokerError):
+        broker.cancel_order(order.id)
+
+
+def test_buys_beyond_buying_power_are_rejected():
+    broker = SimulatedBroker(bars={'AAPL': _bars(100.0, 100.0)}, cash=1000.0, latency=30)
+    broker.advance()
+    with pytest.raises(SimulatedBrokerError):
+        broker.submit_order('AAPL', 11, 'buy')
+
+    # Both fit at submission, but only the first one fits once it has filled
+    first = broker.submit_order('AAPL', 6, 'buy')
+    second = broker.submit_order('AAPL', 6, 'buy')
+    broker.advance()
+    assert broker.get_order(first.id).status == 'filled'
+    starved = broker.get_order(second.id)
+    assert (starved.status, starved.filled_qty) == ('canceled', 4)
+    assert broker.list_orders() == []
+
+
+def test_bars_before_the_clock_are_ignored():
+    broker = SimulatedBroker(bars={'AAPL': _bars(100.0, start=100)})
+    broker.advance()
+    broker.add_bars('AAPL', _bars(50.0, start=50))
+    broker.add_bars('MSFT', _bars(300.0, start=160))
+
+    assert broker.advance() == 160
+    assert broker.advance() is None
+    assert broker.clock == 160
+    assert broker.get_barset('AAPL')['AAPL'][0].c == 100.0
+
+
+@pytest.fixture
+def alpaca_utils(tmp_path, monkeypatch):
+    # alpaca_utils writes logs/ and data/ relative to the working directory on import
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'logs').mkdir()
+    module = importlib.import_module('utils.alpaca_utils')
+    monkeypatch.setattr(module, 'data_directory', f'{tmp_path}/')
+    monkeypatch.setattr(module, 'module_modes', {})
+    trade_history_utils.close_trade_history()
+    trade_history_utils.init_trade_history(str(tmp_path / 'trading_bot.db'))
+    yield module
+    module.use_simulated_broker(None)
+    trade_history_utils.close_trade_history()
+
+
+def test_buy_stock_books_simulated_fills(alpaca_utils):
+    broker = alpaca_utils.use_simulated_broker(SimulatedBroker(
+        bars={'AAPL': _bars(100.0, 110.0, volume=100)}, latency=30, participation=0.3
+    ))
+    alpaca_utils.set_module_mode('tester', 'test')
+    alpaca_utils.save_module_state('tester', {'max_money_per_day': 0, 'max_money_per_transaction': 10000, 'history': []})
+    broker.advance()
+
+    order = alpaca_utils.buy_stock('AAPL', 50, 'tester')
+    assert trade_history_utils.get_trades(venue='simulated')['trades'] == []
+
+    broker.advance()
+    alpaca_utils.sync_order_fills()
+    [trade] = trade_history_utils.get_trades(venue='simulated')['trades']
+    assert (trade['quantity'], trade['price']) == (30, pytest.approx(110.0))
+    assert trade_history_utils.get_trades()['trades'] == []
+    assert trade_history_utils.open_order_ids('simulated') == [order.id]
+
+    # A new broker can't fill the old one's orders, so they are closed
+    alpaca_utils.use_simulated_broker(SimulatedBroker())
+    assert trade_history_utils.open_order_ids('simulated') == []
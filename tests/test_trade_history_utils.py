@@ -0,0 +1,237 @@
+# tests/test_trade_history_utils.py
+import sqlite3
+from contextlib import closing
+from types import SimpleNamespace
+
+import pytest
+
+from utils import trade_history_utils
+
+# 2023-11-14 00:00 UTC
+DAY_ONE = 1699920000.0
+DAY_TWO = DAY_ONE + 86400
+
+
+@pytest.fixture
+def history(tmp_path):
+    trade_history_utils.close_trade_history()
+    trade_history_utils.init_trade_history(str(tmp_path / 'trading_bot.db'))
+    yield trade_history_utils
+    trade_history_utils.close_trade_history()
+
+
+def _order(filled_qty, filled_avg_price, status, order_id='order-1', side='buy'):
+    return SimpleNamespace(id=order_id, symbol='AAPL', side=side, qty=50,
+                           filled_qty=filled_qty, filled_avg_price=filled_avg_price, status=status)
+
+
+def test_long_to_flat_realizes_pnl(history):
+    history.record_trade('m', 'buy', 'AAPL', 10, 100.0, DAY_ONE)
+    history.record_trade('m', 'sell', 'AAPL', 10, 110.0, DAY_ONE + 60)
+
+    pnl = history.get_pnl()
+    assert pnl['total_realized_pnl'] == pytest.approx(100.0)
+    assert pnl['positions'] == []
+    assert pnl['total_unrealized_pnl'] == 0
+
+
+def test_partial_close_keeps_average_cost(history):
+    history.record_trade('m', 'buy', 'AAPL', 10, 100.0, DAY_ONE)
+    history.record_trade('m', 'buy', 'AAPL', 10, 110.0, DAY_ONE + 60)
+    history.record_trade('m', 'sell', 'AAPL', 5, 120.0, DAY_ONE + 120)
+
+    pnl = history.get_pnl()
+    assert pnl['total_realized_pnl'] == pytest.approx(75.0)
+    [position] = pnl['positions']
+    assert position['quantity'] == 15
+    assert position['average_cost'] == pytest.approx(105.0)
+    assert position['unrealized_pnl'] == pytest.approx(15 * (120.0 - 105.0))
+
+
+def test_long_to_short_flip_reopens_at_fill_price(history):
+    history.record_trade('m', 'buy', 'AAPL', 10, 100.0, DAY_ONE)
+    history.record_trade('m', 'sell', 'AAPL', 15, 90.0, DAY_ONE + 60)
+
+    pnl = history.get_pnl()
+    assert pnl['total_realized_pnl'] == pytest.approx(-100.0)
+    [position] = pnl['positions']
+    assert position['quantity'] == -5
+    assert position['average_cost'] == pytest.approx(90.0)
+
+    history.record_trade('m', 'buy', 'AAPL', 5, 80.0, DAY_ONE + 120)
+    pnl = history.get_pnl()
+    assert pnl['total_realized_pnl'] == pytest.approx(-100.0 + 50.0)
+    assert pnl['positions'] == []
+
+
+def test_daily_rollup_groups_and_filters(history):
+    history.record_trade('m', 'buy', 'AAPL', 10, 100.0, DAY_ONE)
+    history.record_trade('m', 'sell', 'AAPL', 4, 105.0, DAY_ONE + 3600)
+    history.record_trade('m', 'sell', 'AAPL', 6, 95.0, DAY_TWO + 3600)
+    history.record_trade('n', 'buy', 'MSFT', 2, 50.0, DAY_TWO)
+
+    by_day = history.get_pnl(module_name='m', group_by=['day'])['realized']
+    assert [row['day'] for row in by_day] == ['2023-11-14', '2023-11-15']
+    assert by_day[0]['realized_pnl'] == pytest.approx(20.0)
+    assert by_day[0]['trade_count'] == 2
+    assert by_day[0]['buy_value'] == pytest.approx(1000.0)
+    assert by_day[1]['realized_pnl'] == pytest.approx(-30.0)
+    assert by_day[1]['sell_quantity'] == 6
+
+    second_day = history.get_pnl(start_day='2023-11-15', group_by=['module_name'])
+    assert [row['module_name'] for row in second_day['realized']] == ['m', 'n']
+    assert second_day['total_realized_pnl'] == pytest.approx(-30.0)
+
+    total = history.get_pnl(group_by=[])['realized']
+    assert total[0]['trade_count'] == 4
+
+
+def test_unknown_group_by_column_is_rejected(history):
+    with pytest.raises(ValueError):
+        history.get_pnl(group_by=['price'])
+
+
+def test_trades_paginate_with_next_before(history):
+    for index in range(5):
+        history.record_trade('m', 'buy', 'AAPL', 1, 100.0 + index, DAY_ONE + index // 2)
+    history.record_trade('other', 'buy', 'AAPL', 1, 1.0, DAY_ONE + 10)
+
+    pages = []
+    before = None
+    while True:
+        page = history.get_trades(module_name='m', before=before, limit=2)
+        pages.append([trade['price'] for trade in page['trades']])
+        before = page['next_before']
+        if before is None:
+            break
+    # Trades sharing a timestamp are split across pages by id
+    assert pages == [[104.0, 103.0], [102.0, 101.0], [100.0]]
+
+
+def test_invalid_page_cursor_is_rejected(history):
+    with pytest.raises(ValueError):
+        history.get_trades(before='not-a-cursor')
+
+
+@pytest.mark.parametrize('filters', [
+    {},
+    {'module_name': 'm'},
+    {'symbol': 'AAPL'},
+    {'module_name': 'm', 'symbol': 'AAPL'},
+    {'since': DAY_ONE},
+    {'module_name': 'm', 'since': DAY_ONE, 'until': DAY_TWO, 'before': f'{DAY_TWO!r}:10'},
+])
+def test_trade_pages_are_served_by_an_index(history, filters):
+    query, values = history._trades_query(limit=100, **filters)
+    with history._read_connection() as connection:
+        plan = ' '.join(row['detail'] for row in connection.execute('EXPLAIN QUERY PLAN ' + query, values))
+    assert 'USING INDEX' in plan or 'USING COVERING INDEX' in plan
+    assert 'TEMP B-TREE' not in plan
+    assert not plan.startswith('SCAN action_history') or 'INDEX' in plan
+
+
+def test_orders_are_recorded_from_reported_fills(history):
+    history.track_order('m', _order(0, None, 'new'))
+    assert history.get_trades()['trades'] == []
+    assert history.open_order_ids() == ['order-1']
+
+    history.sync_order(_order(10, 110.0, 'partially_filled'), DAY_ONE)
+    history.sync_order(_order(10, 110.0, 'partially_filled'), DAY_ONE + 30)
+    history.sync_order(_order(50, 106.0, 'filled'), DAY_ONE + 60)
+
+    trades = history.get_trades()['trades']
+    assert [(trade['quantity'], trade['price']) for trade in trades] == [(40, pytest.approx(105.0)), (10, pytest.approx(110.0))]
+    assert history.open_order_ids() == []
+    [position] = history.get_pnl()['positions']
+    assert position['quantity'] == 50
+    assert position['average_cost'] == pytest.approx(106.0)
+
+
+def test_unfilled_and_untracked_orders_record_nothing(history):
+    history.track_order('m', _order(0, None, 'rejected', order_id='rejected'))
+    history.track_order('m', _order(0, None, 'new', order_id='canceled'))
+    history.sync_order(_order(0, None, 'canceled', order_id='canceled'))
+    assert history.sync_order(_order(5, 100.0, 'filled', order_id='unknown')) is None
+
+    assert history.get_trades()['trades'] == []
+    assert history.open_order_ids() == []
+
+
+def test_mark_price_drives_unrealized_pnl(history):
+    history.record_trade('m', 'buy', 'AAPL', 10, 100.0, DAY_ONE)
+    history.record_trade('n', 'buy', 'AAPL', 10, 100.0, DAY_ONE)
+
+    history.mark_price('AAPL', 110.0, module_name='m')
+    positions = {row['module_name']: row for row in history.get_pnl()['positions']}
+    assert positions['m']['unrealized_pnl'] == pytest.approx(100.0)
+    assert positions['n']['unrealized_pnl'] == pytest.approx(0.0)
+
+    history.mark_price('AAPL', 90.0)
+    assert history.get_pnl()['total_unrealized_pnl'] == pytest.approx(-200.0)
+
+
+def test_open_orders_are_listed_per_venue(history):
+    history.track_order('m', _order(0, None, 'new', order_id='live'), 'alpaca')
+    history.track_order('t', _order(0, None, 'new', order_id='simulated'), 'simulated')
+
+    assert history.open_order_ids('alpaca') == ['live']
+    assert history.open_order_ids('simulated') == ['simulated']
+    assert sorted(history.open_order_ids()) == ['live', 'simulated']
+
+
+def test_venues_are_reported_separately(history):
+    history.record_trade('m', 'buy', 'AAPL', 10, 100.0, DAY_ONE)
+    history.record_trade('m', 'buy', 'AAPL', 10, 50.0, DAY_ONE, venue='simulated')
+    history.record_trade('m', 'sell', 'AAPL', 10, 60.0, DAY_ONE + 60, venue='simulated')
+    history.mark_price('AAPL', 120.0)
+
+    assert [trade['price'] for trade in history.get_trades()['trades']] == [100.0]
+    assert [trade['price'] for trade in history.get_trades(venue='simulated')['trades']] == [60.0, 50.0]
+    real = history.get_pnl()
+    assert real['total_realized_pnl'] == 0
+    assert real['total_unrealized_pnl'] == pytest.approx(200.0)
+    assert history.get_pnl(venue='simulated')['total_realized_pnl'] == pytest.approx(100.0)
+    assert history.open_positions() == [('alpaca', 'm', 'AAPL')]
+    with pytest.raises(ValueError):
+        history.get_pnl(venue='paper')
+
+
+def test_open_orders_of_a_venue_can_be_closed(history):
+    history.track_order('m', _order(0, None, 'new', order_id='live'), 'alpaca')
+    history.track_order('t', _order(0, None, 'new', order_id='simulated'), 'simulated')
+
+    assert history.close_open_orders('simulated') == 1
+    assert history.open_order_ids() == ['live']
+
+
+def test_database_without_venues_is_migrated(tmp_path):
+    path = str(tmp_path / 'old.db')
+    with closing(sqlite3.connect(path)) as connection:
+        connection.execute('''
+        CREATE TABLE action_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, module_name TEXT, action TEXT,
+            symbol TEXT, quantity INTEGER, price REAL, timestamp REAL
+        )
+        ''')
+        connection.execute('''
+        CREATE TABLE position_rollup (
+            module_name TEXT, symbol TEXT, quantity REAL, average_cost REAL,
+            last_price REAL, updated_at REAL, PRIMARY KEY (module_name, symbol)
+        )
+        ''')
+        connection.executemany(
+            'INSERT INTO action_history (module_name, action, symbol, quantity, price, timestamp) VALUES (?, ?, ?, ?, ?, ?)',
+            [('m', 'buy', 'AAPL', 10, 100.0, DAY_ONE), ('m', 'sell', 'AAPL', 4, 110.0, DAY_ONE + 60)]
+        )
+        connection.commit()
+
+    trade_history_utils.close_trade_history()
+    trade_history_utils.init_trade_history(path)
+    try:
+        pnl = trade_history_utils.get_pnl()
+        assert pnl['total_realized_pnl'] == pytest.approx(40.0)
+        [position] = pnl['positions']
+        assert position['quantity'] == 6
+        assert len(trade_history_utils.get_trades()['trades']) == 2
+    finally:
+        trade_history_utils.close_trade_history()
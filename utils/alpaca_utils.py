@@ -1,8 +1,12 @@
 # utils/alpaca_utils.py
 import os
+import time
 import logging
 import alpaca_trade_api as tradeapi
 import json
+import threading
+from utils import trade_history_utils
+from utils.simulated_broker import SimulatedBroker, load_bars
 
 # Configure logging to use bot.log
 logging.basicConfig(
@@ -38,6 +42,14 @@ API_KEY = os.getenv('ALPACA_API_KEY')
 SECRET_KEY = os.getenv('ALPACA_SECRET_KEY')
 BASE_URL = "https://paper-api.alpaca.markets/v2"
 
+# Mode each module was started in. Modules in 'test' mode trade against the
+# local simulated broker instead of Alpaca.
+module_modes = {}
+
+# Simulated broker shared by all test-mode modules (see get_simulated_broker)
+simulated_broker = None
+simulated_broker_lock = threading.Lock()
+
 # Path to store module-related data
 data_directory = 'data/'
 if not os.path.exists(data_directory):
@@ -62,8 +74,56 @@ def save_module_state(module_name, state):
     with open(filepath, 'w') as file:
         json.dump(state, file, indent=4)
 
-# Connect to Alpaca API
-def connect_to_alpaca():
+# Record the mode a module runs in, so its orders go to the right venue
+def set_module_mode(module_name, mode):
+    module_modes[module_name] = mode
+
+def is_simulated(module_name):
+    return module_modes.get(module_name) == 'test'
+
+# Trade history venue of a module's orders and positions
+def venue_for(module_name):
+    return 'simulated' if is_simulated(module_name) else 'alpaca'
+
+# A new simulated broker doesn't know the orders of the one before it, so
+# tracked simulated orders that were still open will never fill
+def close_orphaned_simulated_orders():
+    try:
+        closed = trade_history_utils.close_open_orders('simulated')
+        if closed:
+            logging.info(f"Canceled {closed} open simulated orders left by a previous simulated broker.")
+    except Exception as e:
+        logging.error(f"Failed to cancel open simulated orders: {str(e)}")
+
+# Use the given SimulatedBroker for test-mode modules. Pass None to go back to
+# the default one.
+def use_simulated_broker(broker):
+    global simulated_broker
+    with simulated_broker_lock:
+        simulated_broker = broker
+        close_orphaned_simulated_orders()
+    return broker
+
+# Get the simulated broker for test-mode modules, creating it on first use. It
+# replays the bars in the JSON file named by ALPACA_SIMULATED_BARS, paced to the
+# wall clock and sped up by ALPACA_SIMULATED_SPEED (default 1).
+def get_simulated_broker():
+    global simulated_broker
+    with simulated_broker_lock:
+        if simulated_broker is None:
+            bars_path = os.getenv('ALPACA_SIMULATED_BARS')
+            simulated_broker = SimulatedBroker(bars=load_bars(bars_path) if bars_path else None)
+            close_orphaned_simulated_orders()
+            if bars_path:
+                simulated_broker.advance()
+                simulated_broker.start_replay(speed=float(os.getenv('ALPACA_SIMULATED_SPEED', '1')))
+            logging.info("Started simulated broker for test mode.")
+        return simulated_broker
+
+# Connect to Alpaca API, or to the simulated broker for test-mode modules
+def connect_to_alpaca(module_name=None):
+    if module_name is not None and is_simulated(module_name):
+        return get_simulated_broker()
     try:
         api = tradeapi.REST(API_KEY, SECRET_KEY, BASE_URL, api_version='v2')
         logging.info("Connected to Alpaca API.")
@@ -74,10 +134,10 @@ def connect_to_alpaca():
 
 # Buy stock
 def buy_stock(symbol, quantity, module_name):
-    api = connect_to_alpaca()
+    api = connect_to_alpaca(module_name)
     state = load_module_state(module_name)
     max_per_transaction = state.get("max_money_per_transaction", 0)
-    market_price = get_market_price(symbol) * quantity
+    market_price = get_market_price(symbol, module_name) * quantity
     
     if market_price > max_per_transaction:
         logging.warning(f"Buy order for {symbol} exceeds max money per transaction limit.")
@@ -91,17 +151,20 @@ def buy_stock(symbol, quantity, module_name):
             type='market',
             time_in_force='gtc'
         )
-        logging.info(f"Buy order placed for {quantity} shares of {symbol}.")
-        state["history"].append({"action": "buy", "symbol": symbol, "quantity": quantity, "price": market_price, "timestamp": time.time()})
-        save_module_state(module_name, state)
-        return order
     except Exception as e:
         logging.error(f"Failed to place buy order for {symbol}: {str(e)}")
         raise
 
+    # The order is placed from here on; bookkeeping errors must not look like a failed order
+    logging.info(f"Buy order placed for {quantity} shares of {symbol}.")
+    state["history"].append({"action": "buy", "symbol": symbol, "quantity": quantity, "price": market_price, "timestamp": time.time()})
+    save_module_state(module_name, state)
+    track_order_fills(module_name, order)
+    return order
+
 # Sell stock
 def sell_stock(symbol, quantity, module_name):
-    api = connect_to_alpaca()
+    api = connect_to_alpaca(module_name)
     state = load_module_state(module_name)
     
     try:
@@ -112,29 +175,70 @@ def sell_stock(symbol, quantity, module_name):
             type='market',
             time_in_force='gtc'
         )
-        logging.info(f"Sell order placed for {quantity} shares of {symbol}.")
-        market_price = get_market_price(symbol) * quantity
-        state["history"].append({"action": "sell", "symbol": symbol, "quantity": quantity, "price": market_price, "timestamp": time.time()})
-        save_module_state(module_name, state)
-        return order
     except Exception as e:
         logging.error(f"Failed to place sell order for {symbol}: {str(e)}")
         raise
 
+    # The order is placed from here on; bookkeeping errors must not look like a failed order
+    logging.info(f"Sell order placed for {quantity} shares of {symbol}.")
+    market_price = get_market_price(symbol, module_name) * quantity
+    state["history"].append({"action": "sell", "symbol": symbol, "quantity": quantity, "price": market_price, "timestamp": time.time()})
+    save_module_state(module_name, state)
+    track_order_fills(module_name, order)
+    return order
+
+# Record an order's fills in the trade history as the broker reports them.
+# Errors are logged, not raised, because the order itself was placed.
+def track_order_fills(module_name, order):
+    try:
+        trade_history_utils.track_order(module_name, order, venue_for(module_name))
+    except Exception as e:
+        logging.error(f"Order {order.id} was placed but its fills could not be recorded: {str(e)}")
+
+# Poll the venue of every tracked order that may still fill and record new fills
+def sync_order_fills():
+    for venue in ('alpaca', 'simulated'):
+        order_ids = trade_history_utils.open_order_ids(venue)
+        if not order_ids:
+            continue
+        api = get_simulated_broker() if venue == 'simulated' else connect_to_alpaca()
+        for order_id in order_ids:
+            try:
+                trade_history_utils.sync_order(api.get_order(order_id))
+            except Exception as e:
+                logging.error(f"Failed to sync fills of order {order_id}: {str(e)}")
+
+# Refresh the mark price of every open position, for unrealized P&L. Each
+# position is marked with prices from the venue it was traded on, whatever
+# mode its module runs in now.
+def update_position_marks():
+    symbols = {(venue, symbol) for venue, module_name, symbol in trade_history_utils.open_positions()}
+    for venue, symbol in symbols:
+        api = get_simulated_broker() if venue == 'simulated' else connect_to_alpaca()
+        try:
+            price = _latest_price(api, symbol)
+            trade_history_utils.mark_price(symbol, price, venue=venue)
+        except Exception as e:
+            logging.error(f"Failed to update {venue} mark for {symbol}: {str(e)}")
+
 # Get order status
-def get_order_status(order_id):
-    api = connect_to_alpaca()
+def get_order_status(order_id, module_name=None):
+    api = connect_to_alpaca(module_name)
     try:
         order = api.get_order(order_id)
         logging.info(f"Order status for {order_id}: {order.status}")
-        return order.status
     except Exception as e:
         logging.error(f"Failed to get order status for {order_id}: {str(e)}")
         raise
+    try:
+        trade_history_utils.sync_order(order)
+    except Exception as e:
+        logging.error(f"Failed to sync fills of order {order_id}: {str(e)}")
+    return order.status
 
 # Cancel order
-def cancel_order(order_id):
-    api = connect_to_alpaca()
+def cancel_order(order_id, module_name=None):
+    api = connect_to_alpaca(module_name)
     try:
         api.cancel_order(order_id)
         logging.info(f"Order {order_id} canceled.")
@@ -143,8 +247,8 @@ def cancel_order(order_id):
         raise
 
 # Get account information
-def get_account_info():
-    api = connect_to_alpaca()
+def get_account_info(module_name=None):
+    api = connect_to_alpaca(module_name)
     try:
         account = api.get_account()
         logging.info("Retrieved account information.")
@@ -154,8 +258,8 @@ def get_account_info():
         raise
 
 # Get position information
-def get_position(symbol):
-    api = connect_to_alpaca()
+def get_position(symbol, module_name=None):
+    api = connect_to_alpaca(module_name)
     try:
         position = api.get_position(symbol)
         logging.info(f"Retrieved position for {symbol}.")
@@ -164,24 +268,40 @@ def get_position(symbol):
         logging.error(f"Failed to retrieve position for {symbol}: {str(e)}")
         raise
 
-# Close position
-def close_position(symbol):
-    api = connect_to_alpaca()
+# Close a position. The closing order's fills are recorded against module_name
+# like any other order; without a module the order is placed but not recorded.
+def close_position(symbol, module_name=None):
+    api = connect_to_alpaca(module_name)
     try:
-        api.close_position(symbol)
-        logging.info(f"Closed position for {symbol}.")
+        order = api.close_position(symbol)
     except Exception as e:
         logging.error(f"Failed to close position for {symbol}: {str(e)}")
         raise
 
-# Get market price
-def get_market_price(symbol):
-    api = connect_to_alpaca()
+    logging.info(f"Closed position for {symbol}.")
+    if module_name is not None:
+        track_order_fills(module_name, order)
+    return order
+
+def _latest_price(api, symbol):
+    barset = api.get_barset(symbol, 'minute', limit=1)
+    if not barset.get(symbol):
+        raise ValueError(f"No market data for {symbol}")
+    return barset[symbol][0].c
+
+# Get market price. The price also becomes the mark for unrealized P&L of the
+# module's position on its venue (every module's Alpaca position when
+# module_name is None).
+def get_market_price(symbol, module_name=None):
+    api = connect_to_alpaca(module_name)
     try:
-        barset = api.get_barset(symbol, 'minute', limit=1)
-        bar = barset[symbol][0]
-        logging.info(f"Retrieved market price for {symbol}: {bar.c}")
-        return bar.c
+        price = _latest_price(api, symbol)
+        logging.info(f"Retrieved market price for {symbol}: {price}")
     except Exception as e:
         logging.error(f"Failed to get market price for {symbol}: {str(e)}")
-        raise
\ No newline at end of file
+        raise
+    try:
+        trade_history_utils.mark_price(symbol, price, module_name, venue=venue_for(module_name))
+    except Exception as e:
+        logging.error(f"Failed to update mark for {symbol}: {str(e)}")
+    return price
\ No newline at end of file
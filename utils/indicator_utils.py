@@ -0,0 +1,319 @@
+# utils/indicator_utils.py
+import math
+import numbers
+import inspect
+import threading
+from array import array
+from datetime import datetime, timezone
+
+# Shared indicator cache, keyed by (symbol, indicator name, params)
+_indicator_cache = {}
+# Indicators registered per symbol, so a new bar only touches that symbol's indicators
+_symbol_indicators = {}
+cache_lock = threading.Lock()
+
+
+# Fixed-size ring buffer backed by a float array
+class RingBuffer:
+    def __init__(self, capacity):
+        if capacity < 1:
+            raise ValueError("RingBuffer capacity must be at least 1")
+        self.capacity = capacity
+        self.values = array('d', [0.0] * capacity)
+        self.index = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def is_full(self):
+        return self.count == self.capacity
+
+    # Append a value and return the value it evicted (None while filling up)
+    def append(self, value):
+        evicted = self.values[self.index] if self.count == self.capacity else None
+        self.values[self.index] = value
+        self.index = (self.index + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+        return evicted
+
+    # Values in insertion order, oldest first
+    def to_list(self):
+        if self.count < self.capacity:
+            return list(self.values[:self.count])
+        return list(self.values[self.index:]) + list(self.values[:self.index])
+
+
+# Normalize a bar timestamp (epoch number, datetime or ISO 8601 string) to
+# epoch seconds, so feeds using different representations dedupe against each other
+def to_epoch_seconds(timestamp):
+    if timestamp is None or isinstance(timestamp, (int, float)):
+        return timestamp
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+    if isinstance(timestamp, datetime):
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+        return timestamp.timestamp()
+    return float(timestamp)
+
+
+# Base class for incremental indicators. Every update is O(1).
+class Indicator:
+    def __init__(self, **params):
+        self.params = params
+        self.value = None
+        self.last_timestamp = None
+
+    # Clear all state in place, keeping the same parameters
+    def reset(self):
+        self.__init__(**self.params)
+
+    # Feed one bar. Bars at or before the last seen timestamp are ignored, so
+    # several modules can push the same bar into a shared indicator safely.
+    # Without a timestamp every call counts, which is only safe for an indicator
+    # a single caller owns; the shared update functions below require one.
+    def update(self, price, volume=0.0, timestamp=None):
+        timestamp = to_epoch_seconds(timestamp)
+        if timestamp is not None:
+            if self.last_timestamp is not None and timestamp <= self.last_timestamp:
+                return self.value
+            self.last_timestamp = timestamp
+        self.value = self._update(price, volume)
+        return self.value
+
+    def _update(self, price, volume):
+        raise NotImplementedError
+
+    def is_ready(self):
+        return self.value is not None
+
+
+# Simple moving average over the last `period` prices
+class SMA(Indicator):
+    def __init__(self, period=20):
+        super().__init__(period=period)
+        self.period = period
+        self.buffer = RingBuffer(period)
+        self.total = 0.0
+
+    def _update(self, price, volume):
+        evicted = self.buffer.append(price)
+        self.total += price
+        if evicted is not None:
+            self.total -= evicted
+        if not self.buffer.is_full():
+            return None
+        return self.total / self.period
+
+
+# Exponential moving average, seeded with the SMA of the first `period` prices
+class EMA(Indicator):
+    def __init__(self, period=20):
+        super().__init__(period=period)
+        self.period = period
+        self.alpha = 2.0 / (period + 1)
+        self.seed_total = 0.0
+        self.seed_count = 0
+
+    def _update(self, price, volume):
+        if self.seed_count < self.period:
+            self.seed_total += price
+            self.seed_count += 1
+            if self.seed_count < self.period:
+                return None
+            return self.seed_total / self.period
+        return self.value + self.alpha * (price - self.value)
+
+
+# Relative strength index with Wilder smoothing
+class RSI(Indicator):
+    def __init__(self, period=14):
+        super().__init__(period=period)
+        self.period = period
+        self.previous_price = None
+        self.average_gain = 0.0
+        self.average_loss = 0.0
+        self.change_count = 0
+
+    def _update(self, price, volume):
+        if self.previous_price is None:
+            self.previous_price = price
+            return None
+        change = price - self.previous_price
+        self.previous_price = price
+        gain = change if change > 0 else 0.0
+        loss = -change if change < 0 else 0.0
+
+        if self.change_count < self.period:
+            self.average_gain += gain / self.period
+            self.average_loss += loss / self.period
+            self.change_count += 1
+            if self.change_count < self.period:
+                return None
+        else:
+            self.average_gain = (self.average_gain * (self.period - 1) + gain) / self.period
+            self.average_loss = (self.average_loss * (self.period - 1) + loss) / self.period
+
+        if self.average_loss == 0:
+            return 100.0
+        relative_strength = self.average_gain / self.average_loss
+        return 100.0 - 100.0 / (1.0 + relative_strength)
+
+
+# Volume weighted average price. With period=None it is cumulative (call
+# reset() at the start of each session); otherwise it is a rolling window.
+class VWAP(Indicator):
+    def __init__(self, period=None):
+        super().__init__(period=period)
+        self.period = period
+        self.price_volume_buffer = RingBuffer(period) if period else None
+        self.volume_buffer = RingBuffer(period) if period else None
+        self.total_price_volume = 0.0
+        self.total_volume = 0.0
+
+    def _update(self, price, volume):
+        price_volume = price * volume
+        self.total_price_volume += price_volume
+        self.total_volume += volume
+        if self.period:
+            evicted_price_volume = self.price_volume_buffer.append(price_volume)
+            evicted_volume = self.volume_buffer.append(volume)
+            if evicted_price_volume is not None:
+                self.total_price_volume -= evicted_price_volume
+                self.total_volume -= evicted_volume
+        if self.total_volume <= 0:
+            return None
+        return self.total_price_volume / self.total_volume
+
+
+# Rolling volatility: sample standard deviation of log returns over `period` bars
+class Volatility(Indicator):
+    def __init__(self, period=20):
+        super().__init__(period=period)
+        if period < 2:
+            raise ValueError("Volatility period must be at least 2")
+        self.period = period
+        self.buffer = RingBuffer(period)
+        self.previous_price = None
+        self.total = 0.0
+        self.total_squares = 0.0
+
+    def _update(self, price, volume):
+        if self.previous_price is None or self.previous_price <= 0 or price <= 0:
+            self.previous_price = price
+            return self.value
+        log_return = math.log(price / self.previous_price)
+        self.previous_price = price
+
+        evicted = self.buffer.append(log_return)
+        self.total += log_return
+        self.total_squares += log_return * log_return
+        if evicted is not None:
+            self.total -= evicted
+            self.total_squares -= evicted * evicted
+        if not self.buffer.is_full():
+            return None
+
+        mean = self.total / self.period
+        variance = (self.total_squares - self.period * mean * mean) / (self.period - 1)
+        return math.sqrt(max(variance, 0.0))
+
+
+# Available indicators by name
+INDICATORS = {
+    'sma': SMA,
+    'ema': EMA,
+    'rsi': RSI,
+    'vwap': VWAP,
+    'volatility': Volatility,
+}
+
+
+# Key on the resolved spec (defaults applied), so `sma` and `sma` with
+# period=20 share one instance
+def _resolve_params(name, params):
+    bound = inspect.signature(INDICATORS[name]).bind(**params)
+    bound.apply_defaults()
+    return dict(bound.arguments)
+
+
+def _cache_key(symbol, name, params):
+    return (symbol, name, tuple(sorted(params.items())))
+
+
+# Get the shared indicator for a symbol, creating it on first use. Modules that
+# ask for the same symbol, name and params get the same instance.
+def get_indicator(symbol, name, **params):
+    if name not in INDICATORS:
+        raise ValueError(f"Unknown indicator '{name}'. Available: {', '.join(INDICATORS)}")
+    params = _resolve_params(name, params)
+    key = _cache_key(symbol, name, params)
+    with cache_lock:
+        indicator = _indicator_cache.get(key)
+        if indicator is None:
+            indicator = INDICATORS[name](**params)
+            _indicator_cache[key] = indicator
+            _symbol_indicators.setdefault(symbol, []).append(indicator)
+        return indicator
+
+
+# Check a bar before it touches any shared indicator. Returns (price, volume,
+# timestamp in epoch seconds).
+def _validate_bar(symbol, price, volume, timestamp):
+    if timestamp is None:
+        raise ValueError(f"Bar for {symbol} has no timestamp; shared indicators need one to skip bars already applied")
+    if not isinstance(price, numbers.Real):
+        raise ValueError(f"Bar for {symbol} has no valid close price: {price!r}")
+    return price, volume or 0.0, to_epoch_seconds(timestamp)
+
+
+# Feed one bar into every indicator registered for a symbol
+def update_symbol(symbol, price, volume=0.0, timestamp=None):
+    price, volume, timestamp = _validate_bar(symbol, price, volume, timestamp)
+    with cache_lock:
+        for indicator in _symbol_indicators.get(symbol, ()):
+            indicator.update(price, volume, timestamp)
+
+
+def _bar_field(bar, name):
+    if isinstance(bar, dict):
+        return bar.get(name)
+    return getattr(bar, name, None)
+
+
+# Batch mode: feed a {symbol: bar} mapping into all registered indicators in a
+# single pass. Bars may be dicts or Alpaca bar objects with c, v and t fields;
+# `timestamp` is used for bars without t. Every bar is validated before any is
+# applied, so a bad bar leaves all indicators untouched.
+def update_all(bars, timestamp=None):
+    validated = []
+    for symbol, bar in bars.items():
+        bar_timestamp = _bar_field(bar, 't')
+        if bar_timestamp is None:
+            bar_timestamp = timestamp
+        validated.append((symbol,) + _validate_bar(symbol, _bar_field(bar, 'c'), _bar_field(bar, 'v'), bar_timestamp))
+
+    with cache_lock:
+        for symbol, price, volume, bar_timestamp in validated:
+            for indicator in _symbol_indicators.get(symbol, ()):
+                indicator.update(price, volume, bar_timestamp)
+
+
+# Current values of every indicator registered for a symbol, keyed by (name, params)
+def get_symbol_values(symbol):
+    with cache_lock:
+        return {
+            (name, params): indicator.value
+            for (cached_symbol, name, params), indicator in _indicator_cache.items()
+            if cached_symbol == symbol
+        }
+
+
+# Reset every shared indicator (e.g. at the start of a new trading session).
+# Instances are reset in place, so indicators modules already hold keep updating.
+def clear_indicator_cache():
+    with cache_lock:
+        for indicator in _indicator_cache.values():
+            indicator.reset()
@@ -0,0 +1,360 @@
+# utils/simulated_broker.py
+import json
+import heapq
+import uuid
+import threading
+import time
+from types import SimpleNamespace
+from utils.indicator_utils import to_epoch_seconds
+
+
+# Raised for requests the broker refuses, like Alpaca's APIError
+class SimulatedBrokerError(Exception):
+    pass
+
+
+# Load replay bars from a JSON file shaped like {"AAPL": [{"t": ..., "o": ..., "h": ..., "l": ..., "c": ..., "v": ...}, ...]}
+def load_bars(path):
+    with open(path, 'r') as bars_file:
+        return json.load(bars_file)
+
+
+def _to_bar(bar):
+    if isinstance(bar, dict):
+        close = bar['c']
+        return SimpleNamespace(
+            t=to_epoch_seconds(bar.get('t', 0)),
+            o=bar.get('o', close),
+            h=bar.get('h', close),
+            l=bar.get('l', close),
+            c=close,
+            v=bar.get('v', 0)
+        )
+    return bar
+
+
+# Local stand-in for the Alpaca REST client used by alpaca_utils.
+#
+# Market data comes from replayed bars and time only moves when advance(),
+# run_until() or push_bar() is called, so runs are deterministic. start_replay()
+# instead advances the bars in the background, paced to the wall clock. Orders are filled against the current bar
+# of their symbol:
+#   - latency: seconds (in bar time) before a submitted order can fill
+#   - slippage_bps: fill price is moved this many basis points against the order
+#   - participation: fraction of each bar's volume the simulator may fill,
+#     shared by all orders in that bar; None fills orders in full
+# Buys the cash can't cover are rejected at submission; a resting buy that runs
+# out of cash later fills what it can and is canceled.
+# Bar timestamps are converted to epoch seconds.
+class SimulatedBroker:
+    def __init__(self, bars=None, cash=100000.0, latency=0.0, slippage_bps=0.0, participation=None, history_limit=1000):
+        self.cash = cash
+        self.latency = latency
+        self.slippage_bps = slippage_bps
+        self.participation = participation
+        self.history_limit = history_limit
+        self.clock = None
+        self.orders = {}
+        self.open_orders = {}
+        self.positions = {}
+        self.pending_bars = {}
+        self.bar_history = {}
+        self.bar_liquidity = {}
+        self.bar_queue = []
+        self.lock = threading.RLock()
+        self.replay_stop = threading.Event()
+        if bars:
+            for symbol, symbol_bars in bars.items():
+                self.add_bars(symbol, symbol_bars)
+
+    # Queue bars to replay for a symbol, in time order. Bars before the current
+    # clock are ignored, since replaying them would move time backwards.
+    def add_bars(self, symbol, bars):
+        with self.lock:
+            # Kept newest first so the next bar pops off the end
+            queue = self.pending_bars.setdefault(symbol, [])
+            previous_next = queue[-1].t if queue else None
+            bars = (_to_bar(bar) for bar in bars)
+            queue.extend(bar for bar in bars if self.clock is None or bar.t >= self.clock)
+            queue.sort(key=lambda bar: bar.t, reverse=True)
+            if not queue:
+                return
+            if previous_next is None:
+                heapq.heappush(self.bar_queue, (queue[-1].t, symbol))
+            elif queue[-1].t != previous_next:
+                self.bar_queue = [(pending[-1].t, name) for name, pending in self.pending_bars.items() if pending]
+                heapq.heapify(self.bar_queue)
+
+    # Replay the next bar timestamp for every symbol that has one. Returns the
+    # new clock, or None when there are no bars left.
+    def advance(self):
+        with self.lock:
+            if not self.bar_queue:
+                return None
+            timestamp = self.bar_queue[0][0]
+            while self.bar_queue and self.bar_queue[0][0] == timestamp:
+                _, symbol = heapq.heappop(self.bar_queue)
+                queue = self.pending_bars[symbol]
+                self._open_bar(symbol, queue.pop())
+                if queue:
+                    heapq.heappush(self.bar_queue, (queue[-1].t, symbol))
+            self.clock = timestamp
+            for symbol in list(self.open_orders):
+                self._match(symbol)
+            return timestamp
+
+    # Replay bars until the clock reaches `timestamp`
+    def run_until(self, timestamp):
+        with self.lock:
+            while self.bar_queue and self.bar_queue[0][0] <= timestamp:
+                self.advance()
+            return self.clock
+
+    # Replay the queued bars in a background thread, paced to the wall clock.
+    # speed=60 replays one minute of bars per second.
+    def start_replay(self, speed=1.0):
+        self.replay_stop.clear()
+        thread = threading.Thread(target=self._replay, args=(speed,), daemon=True)
+        thread.start()
+        return thread
+
+    def stop_replay(self):
+        self.replay_stop.set()
+
+    def _replay(self, speed):
+        with self.lock:
+            if not self.bar_queue:
+                return
+            # Pace from the current clock if bars were already replayed
+            first_timestamp = self.clock if self.clock is not None else self.bar_queue[0][0]
+        started = time.monotonic()
+        while not self.replay_stop.is_set():
+            with self.lock:
+                if not self.bar_queue:
+                    return
+                next_timestamp = self.bar_queue[0][0]
+            delay = started + (next_timestamp - first_timestamp) / speed - time.monotonic()
+            if delay > 0 and self.replay_stop.wait(delay):
+                return
+            self.advance()
+
+    # Push a single live bar for a symbol and fill any orders waiting on it
+    def push_bar(self, symbol, bar):
+        with self.lock:
+            bar = _to_bar(bar)
+            self._open_bar(symbol, bar)
+            if self.clock is None or bar.t > self.clock:
+                self.clock = bar.t
+            self._match(symbol)
+
+    def _open_bar(self, symbol, bar):
+        history = self.bar_history.setdefault(symbol, [])
+        history.append(bar)
+        if len(history) > self.history_limit:
+            del history[:len(history) - self.history_limit]
+        if self.participation is None:
+            self.bar_liquidity[symbol] = None
+        else:
+            self.bar_liquidity[symbol] = int(bar.v * self.participation)
+        position = self.positions.get(symbol)
+        if position is not None:
+            position.current_price = bar.c
+
+    def _current_bar(self, symbol):
+        history = self.bar_history.get(symbol)
+        return history[-1] if history else None
+
+    def _fill_price(self, side, bar):
+        slippage = bar.c * self.slippage_bps / 10000.0
+        return bar.c + slippage if side == 'buy' else bar.c - slippage
+
+    # Try to fill every open order in a symbol against its current bar, oldest first
+    def _match(self, symbol):
+        orders = self.open_orders.get(symbol)
+        bar = self._current_bar(symbol)
+        if not orders or bar is None:
+            return
+        for order in list(orders.values()):
+            self._match_order(order, bar)
+
+    # Try to fill one order and drop it from the open orders once it is done
+    def _match_order(self, order, bar):
+        if order.eligible_at is None or bar.t >= order.eligible_at:
+            self._try_fill(order, bar)
+        if order.status not in ('new', 'accepted', 'partially_filled'):
+            self._remove_open_order(order)
+
+    def _remove_open_order(self, order):
+        orders = self.open_orders.get(order.symbol)
+        if orders is not None:
+            orders.pop(order.id, None)
+            if not orders:
+                del self.open_orders[order.symbol]
+
+    def _try_fill(self, order, bar):
+        price = self._fill_price(order.side, bar)
+        if order.type == 'limit':
+            if (order.side == 'buy' and price > order.limit_price) or (order.side == 'sell' and price < order.limit_price):
+                return
+        quantity = order.qty - order.filled_qty
+        liquidity = self.bar_liquidity.get(order.symbol)
+        if liquidity is not None:
+            quantity = min(quantity, liquidity)
+        # Fill what the cash covers; the rest of the order can never fill
+        out_of_cash = order.side == 'buy' and quantity * price > self.cash
+        if out_of_cash:
+            quantity = int(self.cash // price)
+        if liquidity is not None:
+            self.bar_liquidity[order.symbol] = liquidity - max(quantity, 0)
+        if quantity > 0:
+            self._apply_fill(order, quantity, price, bar.t)
+        if out_of_cash:
+            order.status = 'canceled' if order.filled_qty else 'rejected'
+        elif order.time_in_force == 'ioc' and order.filled_qty < order.qty:
+            order.status = 'canceled'
+
+    def _apply_fill(self, order, quantity, price, timestamp):
+        previous_value = (order.filled_avg_price or 0.0) * order.filled_qty
+        order.filled_qty += quantity
+        order.filled_avg_price = (previous_value + quantity * price) / order.filled_qty
+        order.status = 'filled' if order.filled_qty == order.qty else 'partially_filled'
+        if order.status == 'filled':
+            order.filled_at = timestamp
+
+        signed_quantity = quantity if order.side == 'buy' else -quantity
+        self.cash -= signed_quantity * price
+        position = self.positions.get(order.symbol)
+        if position is None:
+            position = SimpleNamespace(symbol=order.symbol, qty=0, avg_entry_price=0.0, current_price=price)
+            self.positions[order.symbol] = position
+        new_quantity = position.qty + signed_quantity
+        if new_quantity == 0:
+            del self.positions[order.symbol]
+            return
+        if position.qty == 0 or (position.qty > 0) == (signed_quantity > 0):
+            position.avg_entry_price = (position.qty * position.avg_entry_price + signed_quantity * price) / new_quantity
+        elif (new_quantity > 0) != (position.qty > 0):
+            position.avg_entry_price = price
+        position.qty = new_quantity
+
+    def _snapshot_order(self, order):
+        return SimpleNamespace(**vars(order))
+
+    def _snapshot_position(self, position):
+        market_value = position.qty * position.current_price
+        return SimpleNamespace(
+            symbol=position.symbol,
+            qty=position.qty,
+            side='long' if position.qty > 0 else 'short',
+            avg_entry_price=position.avg_entry_price,
+            current_price=position.current_price,
+            market_value=market_value,
+            cost_basis=position.qty * position.avg_entry_price,
+            unrealized_pl=market_value - position.qty * position.avg_entry_price
+        )
+
+    # Alpaca REST surface used by alpaca_utils
+
+    def submit_order(self, symbol, qty, side, type='market', time_in_force='day', limit_price=None, client_order_id=None, **kwargs):
+        if side not in ('buy', 'sell'):
+            raise SimulatedBrokerError(f"invalid side '{side}'")
+        if type not in ('market', 'limit'):
+            raise SimulatedBrokerError(f"order type '{type}' is not supported by the simulator")
+        if type == 'limit' and limit_price is None:
+            raise SimulatedBrokerError("limit orders need a limit_price")
+        qty = int(qty)
+        if qty <= 0:
+            raise SimulatedBrokerError("qty must be positive")
+
+        with self.lock:
+            # Like Alpaca, refuse buys the account can't pay for at the
+            # current price (or the limit price)
+            bar = self._current_bar(symbol)
+            if side == 'buy' and (limit_price is not None or bar is not None):
+                price = float(limit_price) if limit_price is not None else self._fill_price(side, bar)
+                if qty * price > self.cash:
+                    raise SimulatedBrokerError(f"insufficient buying power: {qty} {symbol} costs {qty * price:.2f}, cash is {self.cash:.2f}")
+            order = SimpleNamespace(
+                id=str(uuid.uuid4()),
+                client_order_id=client_order_id or str(uuid.uuid4()),
+                symbol=symbol,
+                qty=qty,
+                filled_qty=0,
+                side=side,
+                type=type,
+                time_in_force=time_in_force,
+                limit_price=float(limit_price) if limit_price is not None else None,
+                status='new',
+                filled_avg_price=None,
+                submitted_at=self.clock,
+                filled_at=None,
+                eligible_at=self.clock + self.latency if self.clock is not None and self.latency else None
+            )
+            self.orders[order.id] = order
+            self.open_orders.setdefault(symbol, {})[order.id] = order
+            # Only the new order is matched here; resting orders are rematched on each bar
+            if order.eligible_at is None and bar is not None:
+                self._match_order(order, bar)
+            return self._snapshot_order(order)
+
+    def get_order(self, order_id):
+        with self.lock:
+            order = self.orders.get(order_id)
+            if order is None:
+                raise SimulatedBrokerError(f"order {order_id} not found")
+            return self._snapshot_order(order)
+
+    def list_orders(self, status='open', limit=50):
+        with self.lock:
+            if status == 'open':
+                orders = [order for symbol_orders in self.open_orders.values() for order in symbol_orders.values()]
+            else:
+                orders = list(self.orders.values())
+            return [self._snapshot_order(order) for order in orders[-limit:]]
+
+    def cancel_order(self, order_id):
+        with self.lock:
+            order = self.orders.get(order_id)
+            if order is None:
+                raise SimulatedBrokerError(f"order {order_id} not found")
+            if order.status not in ('new', 'accepted', 'partially_filled'):
+                raise SimulatedBrokerError(f"order {order_id} is already {order.status}")
+            order.status = 'canceled'
+            self._remove_open_order(order)
+
+    def get_account(self):
+        with self.lock:
+            market_value = sum(position.qty * position.current_price for position in self.positions.values())
+            return SimpleNamespace(
+                status='ACTIVE',
+                currency='USD',
+                cash=self.cash,
+                buying_power=self.cash,
+                portfolio_value=self.cash + market_value,
+                equity=self.cash + market_value
+            )
+
+    def get_position(self, symbol):
+        with self.lock:
+            position = self.positions.get(symbol)
+            if position is None:
+                raise SimulatedBrokerError("position does not exist")
+            return self._snapshot_position(position)
+
+    def list_positions(self):
+        with self.lock:
+            return [self._snapshot_position(position) for position in self.positions.values()]
+
+    def close_position(self, symbol):
+        with self.lock:
+            position = self.positions.get(symbol)
+            if position is None:
+                raise SimulatedBrokerError("position does not exist")
+            side = 'sell' if position.qty > 0 else 'buy'
+            return self.submit_order(symbol, abs(position.qty), side, type='market', time_in_force='day')
+
+    def get_barset(self, symbols, timeframe='minute', limit=1, **kwargs):
+        if isinstance(symbols, str):
+            symbols = symbols.split(',')
+        with self.lock:
+            return {symbol: list(self.bar_history.get(symbol, [])[-limit:]) for symbol in symbols}
@@ -0,0 +1,485 @@
+# utils/trade_history_utils.py
+import os
+import time
+import sqlite3
+import logging
+import threading
+from contextlib import closing
+from urllib.parse import quote
+
+# Trade history lives in the bot database alongside module_state
+DATABASE_PATH = 'database/trading_bot.db'
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Columns the P&L rollup can be grouped by
+PNL_GROUP_COLUMNS = ('module_name', 'symbol', 'day')
+
+# Broker a fill came from. Simulated fills are kept apart from real ones in
+# every table and query.
+VENUES = ('alpaca', 'simulated')
+DEFAULT_VENUE = 'alpaca'
+
+# Order statuses after which an order will not fill any further
+FINAL_ORDER_STATUSES = ('filled', 'canceled', 'expired', 'rejected', 'replaced')
+
+# Writer connection, only used under history_lock. Queries open their own
+# read-only connections so they never wait on this lock.
+_connection = None
+_database_path = None
+history_lock = threading.Lock()
+
+
+# Open the shared writer connection and create the trade tables, indexes and rollups
+def init_trade_history(database_path=None):
+    global _connection, _database_path
+    with history_lock:
+        if _connection is not None:
+            return _connection
+        path = database_path or DATABASE_PATH
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        connection = sqlite3.connect(path, check_same_thread=False)
+        connection.row_factory = sqlite3.Row
+        # WAL lets reporting readers run without blocking the bot's writes
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+
+        # One row per fill
+        connection.execute('''
+        CREATE TABLE IF NOT EXISTS action_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            module_name TEXT,
+            action TEXT,
+            symbol TEXT,
+            quantity INTEGER,
+            price REAL,
+            timestamp REAL,
+            venue TEXT NOT NULL DEFAULT 'alpaca'
+        )
+        ''')
+        rebuild_rollups = _migrate_venue(connection)
+        connection.execute('CREATE INDEX IF NOT EXISTS idx_action_history_venue_module_time ON action_history (venue, module_name, timestamp)')
+        connection.execute('CREATE INDEX IF NOT EXISTS idx_action_history_venue_symbol_time ON action_history (venue, symbol, timestamp)')
+        connection.execute('CREATE INDEX IF NOT EXISTS idx_action_history_venue_module_symbol_time ON action_history (venue, module_name, symbol, timestamp)')
+        connection.execute('CREATE INDEX IF NOT EXISTS idx_action_history_venue_time ON action_history (venue, timestamp)')
+
+        # Running position per venue, module and symbol, used for unrealized P&L
+        connection.execute('''
+        CREATE TABLE IF NOT EXISTS position_rollup (
+            venue TEXT,
+            module_name TEXT,
+            symbol TEXT,
+            quantity REAL,
+            average_cost REAL,
+            last_price REAL,
+            updated_at REAL,
+            PRIMARY KEY (venue, module_name, symbol)
+        )
+        ''')
+
+        # Realized P&L and volume per venue, module, symbol and UTC day
+        connection.execute('''
+        CREATE TABLE IF NOT EXISTS daily_pnl_rollup (
+            venue TEXT,
+            module_name TEXT,
+            symbol TEXT,
+            day TEXT,
+            realized_pnl REAL,
+            buy_quantity REAL,
+            sell_quantity REAL,
+            buy_value REAL,
+            sell_value REAL,
+            trade_count INTEGER,
+            PRIMARY KEY (venue, module_name, symbol, day)
+        )
+        ''')
+        connection.execute('CREATE INDEX IF NOT EXISTS idx_daily_pnl_venue_day ON daily_pnl_rollup (venue, day)')
+        if rebuild_rollups:
+            _rebuild_rollups(connection)
+
+        # Fill progress of submitted orders, so each fill is recorded exactly once
+        connection.execute('''
+        CREATE TABLE IF NOT EXISTS order_fills (
+            order_id TEXT PRIMARY KEY,
+            module_name TEXT,
+            symbol TEXT,
+            side TEXT,
+            venue TEXT,
+            filled_quantity REAL,
+            filled_value REAL,
+            status TEXT,
+            updated_at REAL
+        )
+        ''')
+        connection.execute('CREATE INDEX IF NOT EXISTS idx_order_fills_status ON order_fills (status)')
+        connection.commit()
+        _connection = connection
+        _database_path = os.path.abspath(path)
+        return connection
+
+
+# Bring a database from before fills were split by venue up to date. Existing
+# fills are Alpaca fills; the old indexes are replaced by ones led by venue,
+# and the rollups are dropped so they can be rebuilt with venue in their keys.
+# Returns True when the rollups need rebuilding.
+def _migrate_venue(connection):
+    columns = [row['name'] for row in connection.execute('PRAGMA table_info(action_history)')]
+    if 'venue' not in columns:
+        connection.execute(f"ALTER TABLE action_history ADD COLUMN venue TEXT NOT NULL DEFAULT '{DEFAULT_VENUE}'")
+    for index in ('idx_action_history_module_time', 'idx_action_history_symbol_time',
+                  'idx_action_history_module_symbol_time', 'idx_action_history_time', 'idx_daily_pnl_day'):
+        connection.execute(f'DROP INDEX IF EXISTS {index}')
+
+    rollup_columns = [row['name'] for row in connection.execute('PRAGMA table_info(position_rollup)')]
+    if rollup_columns and 'venue' not in rollup_columns:
+        connection.execute('DROP TABLE position_rollup')
+        connection.execute('DROP TABLE IF EXISTS daily_pnl_rollup')
+        return True
+    return False
+
+
+# Replay every recorded fill into empty rollups
+def _rebuild_rollups(connection):
+    rows = connection.execute(
+        'SELECT venue, module_name, action, symbol, quantity, price, timestamp FROM action_history ORDER BY timestamp, id'
+    ).fetchall()
+    for row in rows:
+        _update_rollups(connection, row['venue'], row['module_name'], row['action'], row['symbol'],
+                        row['quantity'], row['price'], row['timestamp'])
+
+
+# Close the writer connection (the next call reopens it, possibly on another path)
+def close_trade_history():
+    global _connection, _database_path
+    with history_lock:
+        if _connection is not None:
+            _connection.close()
+        _connection = None
+        _database_path = None
+
+
+def _get_connection():
+    if _connection is None:
+        init_trade_history()
+    return _connection
+
+
+# Read-only connection for queries. WAL lets it read while the bot writes.
+def _read_connection():
+    _get_connection()
+    connection = sqlite3.connect(f'file:{quote(_database_path)}?mode=ro', uri=True, check_same_thread=False)
+    connection.row_factory = sqlite3.Row
+    return connection
+
+
+def _day_for(timestamp):
+    return time.strftime('%Y-%m-%d', time.gmtime(timestamp))
+
+
+# Apply a signed fill to a position using average cost.
+# Returns the new quantity, new average cost and the realized P&L of the fill.
+def _apply_fill(quantity, average_cost, fill_quantity, price):
+    if quantity == 0 or (quantity > 0) == (fill_quantity > 0):
+        new_quantity = quantity + fill_quantity
+        new_cost = (quantity * average_cost + fill_quantity * price) / new_quantity
+        return new_quantity, new_cost, 0.0
+
+    closed = min(abs(quantity), abs(fill_quantity))
+    direction = 1 if quantity > 0 else -1
+    realized = closed * (price - average_cost) * direction
+    new_quantity = quantity + fill_quantity
+    if new_quantity == 0:
+        return 0, 0.0, realized
+    if (new_quantity > 0) != (quantity > 0):
+        # Position flipped; the remainder was opened at this price
+        return new_quantity, price, realized
+    return new_quantity, average_cost, realized
+
+
+# Insert one fill and update the rollups. The caller holds history_lock and commits.
+def _insert_fill(connection, venue, module_name, action, symbol, quantity, price, timestamp):
+    cursor = connection.execute('''
+        INSERT INTO action_history (venue, module_name, action, symbol, quantity, price, timestamp)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (venue, module_name, action, symbol, quantity, price, timestamp))
+    _update_rollups(connection, venue, module_name, action, symbol, quantity, price, timestamp)
+    return cursor.lastrowid
+
+
+def _update_rollups(connection, venue, module_name, action, symbol, quantity, price, timestamp):
+    day = _day_for(timestamp)
+    signed_quantity = quantity if action == 'buy' else -quantity
+
+    row = connection.execute(
+        'SELECT quantity, average_cost FROM position_rollup WHERE venue = ? AND module_name = ? AND symbol = ?',
+        (venue, module_name, symbol)
+    ).fetchone()
+    position_quantity, average_cost = (row['quantity'], row['average_cost']) if row else (0, 0.0)
+    position_quantity, average_cost, realized = _apply_fill(position_quantity, average_cost, signed_quantity, price)
+
+    connection.execute('''
+        INSERT OR REPLACE INTO position_rollup (venue, module_name, symbol, quantity, average_cost, last_price, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (venue, module_name, symbol, position_quantity, average_cost, price, timestamp))
+
+    value = quantity * price
+    connection.execute('''
+        INSERT INTO daily_pnl_rollup (venue, module_name, symbol, day, realized_pnl, buy_quantity, sell_quantity, buy_value, sell_value, trade_count)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 1)
+        ON CONFLICT (venue, module_name, symbol, day) DO UPDATE SET
+            realized_pnl = realized_pnl + excluded.realized_pnl,
+            buy_quantity = buy_quantity + excluded.buy_quantity,
+            sell_quantity = sell_quantity + excluded.sell_quantity,
+            buy_value = buy_value + excluded.buy_value,
+            sell_value = sell_value + excluded.sell_value,
+            trade_count = trade_count + 1
+    ''', (venue, module_name, symbol, day, realized,
+          quantity if action == 'buy' else 0, quantity if action == 'sell' else 0,
+          value if action == 'buy' else 0.0, value if action == 'sell' else 0.0))
+
+
+def _check_venue(venue):
+    if venue not in VENUES:
+        raise ValueError(f"Unknown venue '{venue}'. Use one of: {', '.join(VENUES)}")
+
+
+# Record one fill and update the rollups in the same transaction.
+# `price` is the per-share fill price.
+def record_trade(module_name, action, symbol, quantity, price, timestamp=None, venue=DEFAULT_VENUE):
+    _check_venue(venue)
+    if action not in ('buy', 'sell'):
+        raise ValueError(f"Unknown trade action '{action}'")
+    if quantity <= 0:
+        raise ValueError(f"Trade quantity must be positive, got {quantity}")
+    timestamp = timestamp if timestamp is not None else time.time()
+
+    connection = _get_connection()
+    with history_lock:
+        try:
+            trade_id = _insert_fill(connection, venue, module_name, action, symbol, quantity, price, timestamp)
+            connection.commit()
+            return trade_id
+        except Exception as e:
+            connection.rollback()
+            logging.error(f"Failed to record {action} of {quantity} {symbol} for {module_name}: {str(e)}")
+            raise
+
+
+# Start tracking a submitted broker order and record whatever has filled so far.
+# `venue` names the broker the order was sent to ('alpaca' or 'simulated').
+def track_order(module_name, order, venue=DEFAULT_VENUE):
+    _check_venue(venue)
+    connection = _get_connection()
+    with history_lock:
+        connection.execute('''
+            INSERT OR IGNORE INTO order_fills (order_id, module_name, symbol, side, venue, filled_quantity, filled_value, status, updated_at)
+            VALUES (?, ?, ?, ?, ?, 0, 0.0, ?, ?)
+        ''', (str(order.id), module_name, order.symbol, order.side, venue, order.status, time.time()))
+        connection.commit()
+    return sync_order(order)
+
+
+# Record the fills of a tracked order that happened since the last sync, using
+# the broker's filled_qty and filled_avg_price. Returns the new trade id, if any.
+def sync_order(order, timestamp=None):
+    timestamp = timestamp if timestamp is not None else time.time()
+    filled_quantity = float(order.filled_qty or 0)
+    filled_value = filled_quantity * float(order.filled_avg_price or 0)
+
+    connection = _get_connection()
+    with history_lock:
+        try:
+            row = connection.execute(
+                'SELECT venue, module_name, symbol, side, filled_quantity, filled_value FROM order_fills WHERE order_id = ?',
+                (str(order.id),)
+            ).fetchone()
+            if row is None:
+                return None
+            trade_id = None
+            new_quantity = filled_quantity - row['filled_quantity']
+            if new_quantity > 0:
+                price = (filled_value - row['filled_value']) / new_quantity
+                trade_id = _insert_fill(connection, row['venue'], row['module_name'], row['side'], row['symbol'], new_quantity, price, timestamp)
+            connection.execute(
+                'UPDATE order_fills SET filled_quantity = ?, filled_value = ?, status = ?, updated_at = ? WHERE order_id = ?',
+                (max(filled_quantity, row['filled_quantity']), max(filled_value, row['filled_value']), order.status, timestamp, str(order.id))
+            )
+            connection.commit()
+            return trade_id
+        except Exception as e:
+            connection.rollback()
+            logging.error(f"Failed to record fills of order {order.id}: {str(e)}")
+            raise
+
+
+# Ids of tracked orders that may still fill, optionally only those on one venue
+def open_order_ids(venue=None):
+    placeholders = ', '.join('?' for _ in FINAL_ORDER_STATUSES)
+    query = f'SELECT order_id FROM order_fills WHERE status NOT IN ({placeholders})'
+    values = list(FINAL_ORDER_STATUSES)
+    if venue is not None:
+        query += ' AND venue = ?'
+        values.append(venue)
+    connection = _get_connection()
+    with history_lock:
+        rows = connection.execute(query, values).fetchall()
+    return [row['order_id'] for row in rows]
+
+
+# Mark every tracked order on a venue that may still fill as `status`. Used when
+# the venue forgot its orders, like a simulated broker that was restarted.
+# Returns the number of orders closed.
+def close_open_orders(venue, status='canceled'):
+    _check_venue(venue)
+    placeholders = ', '.join('?' for _ in FINAL_ORDER_STATUSES)
+    connection = _get_connection()
+    with history_lock:
+        cursor = connection.execute(
+            f'UPDATE order_fills SET status = ?, updated_at = ? WHERE venue = ? AND status NOT IN ({placeholders})',
+            [status, time.time(), venue] + list(FINAL_ORDER_STATUSES)
+        )
+        connection.commit()
+    return cursor.rowcount
+
+
+# Update the mark price used for unrealized P&L on the positions in a symbol
+# on one venue, optionally only for one module
+def mark_price(symbol, price, module_name=None, timestamp=None, venue=DEFAULT_VENUE):
+    timestamp = timestamp if timestamp is not None else time.time()
+    query = 'UPDATE position_rollup SET last_price = ?, updated_at = ? WHERE venue = ? AND symbol = ?'
+    values = [price, timestamp, venue, symbol]
+    if module_name is not None:
+        query += ' AND module_name = ?'
+        values.append(module_name)
+    connection = _get_connection()
+    with history_lock:
+        connection.execute(query, values)
+        connection.commit()
+
+
+# Open positions as (venue, module_name, symbol), for refreshing marks
+def open_positions():
+    with closing(_read_connection()) as connection:
+        rows = connection.execute('SELECT venue, module_name, symbol FROM position_rollup WHERE quantity != 0').fetchall()
+    return [(row['venue'], row['module_name'], row['symbol']) for row in rows]
+
+
+# Build the trade page query. Pages are ordered by (timestamp, id) so the
+# venue-led module, symbol and time indexes cover both the filter and the sort.
+def _trades_query(module_name=None, symbol=None, since=None, until=None, before=None, limit=DEFAULT_PAGE_SIZE, venue=DEFAULT_VENUE):
+    _check_venue(venue)
+    conditions = ['venue = ?']
+    values = [venue]
+    if module_name is not None:
+        conditions.append('module_name = ?')
+        values.append(module_name)
+    if symbol is not None:
+        conditions.append('symbol = ?')
+        values.append(symbol)
+    if since is not None:
+        conditions.append('timestamp >= ?')
+        values.append(since)
+    if until is not None:
+        conditions.append('timestamp < ?')
+        values.append(until)
+    if before is not None:
+        before_timestamp, before_id = _parse_cursor(before)
+        conditions.append('(timestamp, id) < (?, ?)')
+        values.extend([before_timestamp, before_id])
+
+    query = 'SELECT id, venue, module_name, action, symbol, quantity, price, timestamp FROM action_history'
+    query += ' WHERE ' + ' AND '.join(conditions)
+    query += ' ORDER BY timestamp DESC, id DESC LIMIT ?'
+    values.append(limit + 1)
+    return query, values
+
+
+# Page cursors are "<timestamp>:<id>" of the last trade on the previous page
+def _parse_cursor(cursor):
+    try:
+        timestamp, trade_id = str(cursor).rsplit(':', 1)
+        return float(timestamp), int(trade_id)
+    except ValueError:
+        raise ValueError(f"Invalid page cursor '{cursor}'")
+
+
+# Page through the fills on one venue, newest first. Pass the returned
+# `next_before` back as `before` to get the next page; it is None on the last page.
+def get_trades(module_name=None, symbol=None, since=None, until=None, before=None, limit=DEFAULT_PAGE_SIZE, venue=DEFAULT_VENUE):
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    query, values = _trades_query(module_name, symbol, since, until, before, limit, venue)
+    with closing(_read_connection()) as connection:
+        rows = connection.execute(query, values).fetchall()
+    trades = [dict(row) for row in rows[:limit]]
+    next_before = f"{trades[-1]['timestamp']!r}:{trades[-1]['id']}" if len(rows) > limit else None
+    return {'trades': trades, 'next_before': next_before}
+
+
+# Realized P&L on one venue from the daily rollup, grouped by any of
+# module_name, symbol and day, plus unrealized P&L of the open positions
+# matching the filters.
+def get_pnl(module_name=None, symbol=None, start_day=None, end_day=None, group_by=PNL_GROUP_COLUMNS, venue=DEFAULT_VENUE):
+    _check_venue(venue)
+    group_by = tuple(group_by)
+    for column in group_by:
+        if column not in PNL_GROUP_COLUMNS:
+            raise ValueError(f"Cannot group P&L by '{column}'. Use any of: {', '.join(PNL_GROUP_COLUMNS)}")
+
+    conditions = ['venue = ?']
+    values = [venue]
+    if module_name is not None:
+        conditions.append('module_name = ?')
+        values.append(module_name)
+    if symbol is not None:
+        conditions.append('symbol = ?')
+        values.append(symbol)
+    position_conditions = list(conditions)
+    position_values = list(values)
+    if start_day is not None:
+        conditions.append('day >= ?')
+        values.append(start_day)
+    if end_day is not None:
+        conditions.append('day <= ?')
+        values.append(end_day)
+
+    select_columns = ', '.join(group_by + ('',)) if group_by else ''
+    query = f'''
+        SELECT {select_columns}
+            SUM(realized_pnl) AS realized_pnl,
+            SUM(buy_quantity) AS buy_quantity,
+            SUM(sell_quantity) AS sell_quantity,
+            SUM(buy_value) AS buy_value,
+            SUM(sell_value) AS sell_value,
+            SUM(trade_count) AS trade_count
+        FROM daily_pnl_rollup
+    '''
+    query += ' WHERE ' + ' AND '.join(conditions)
+    if group_by:
+        query += ' GROUP BY ' + ', '.join(group_by) + ' ORDER BY ' + ', '.join(group_by)
+
+    position_query = '''
+        SELECT module_name, symbol, quantity, average_cost, last_price,
+            quantity * (last_price - average_cost) AS unrealized_pnl
+        FROM position_rollup
+        WHERE quantity != 0 AND
+    '''
+    position_query += ' AND '.join(position_conditions)
+    position_query += ' ORDER BY module_name, symbol'
+
+    with closing(_read_connection()) as connection:
+        # One read transaction, so realized and unrealized come from the same snapshot
+        connection.execute('BEGIN')
+        realized = [dict(row) for row in connection.execute(query, values).fetchall()]
+        positions = [dict(row) for row in connection.execute(position_query, position_values).fetchall()]
+    if not group_by and realized and realized[0]['trade_count'] is None:
+        realized = []
+
+    return {
+        'realized': realized,
+        'positions': positions,
+        'total_realized_pnl': sum(row['realized_pnl'] or 0.0 for row in realized),
+        'total_unrealized_pnl': sum(row['unrealized_pnl'] for row in positions),
+    }